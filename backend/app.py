@@ -1,60 +1,100 @@
-from flask import Flask, request, jsonify
+import os
+from flask import Flask, Blueprint, Response, request, jsonify, make_response, stream_with_context
 from models import *
 from flask_cors import CORS
-from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity, unset_jwt_cookies
+from sqlalchemy.exc import IntegrityError
+from flask_jwt_extended import JWTManager, create_access_token, jwt_required, unset_jwt_cookies
 from datetime import datetime, date
-import workers, task
+import workers, task, auth, database
+from database import database_uri, engine_options
+from auth import current_identity, is_admin, admin_required
+from schema import upgrade_schema, remove_duplicates
+from pagination import list_response
+from rollups import record_attempt, rebuild_rollups, remove_quiz_scores, ensure_rollups
+from grading import get_answer_key, grade
 from mailer import mail
-from io import BytesIO, StringIO
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
-from flask_caching import Cache
-
-app = Flask(__name__)
-
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///quizmaster.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['JWT_SECRET_KEY'] = 'super-secret'
-
-# MailHog Configuration
-app.config['MAIL_SERVER'] = 'localhost'
-app.config['MAIL_PORT'] = 1025
-app.config['MAIL_USE_TLS'] = False
-app.config['MAIL_USE_SSL'] = False
-app.config['MAIL_DEFAULT_SENDER'] = 'quizme@example.com'
-
-app.config['CACHE_TYPE'] = 'redis'
-app.config['CACHE_REDIS_URL'] = 'redis://localhost:6379/0'
-
-# Initialize extensions
-db.init_app(app)
-bcrypt = Bcrypt(app)
-jwt = JWTManager(app)
-
-# Enable CORS for all routes with proper configuration
-CORS(app, 
-     resources={
-         r"/*": {
-             "origins": "http://localhost:8080",
-             "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-             "allow_headers": ["Content-Type", "Authorization"],
-             "supports_credentials": True,
-             "expose_headers": ["Content-Type", "Authorization"]
-         }
-     })
-
-mail.init_app(app)
-cache = Cache(app)
+from passwords import generate_password_hash, check_password_hash, needs_rehash
+from caching import cache, cached_response, bump_version, version_etag
+from charts import CHART_FORMATS, chart_response
+from question_io import IMPORT_FORMATS, import_format, iter_records, import_questions, export_questions
+from submissions import queued_submissions, enqueue_submission, get_result, score_summary
+from events import publish_attempts, publish_counts, serialize_activity, stream_activity, active_quiz_count, dashboard_summary
+from lifecycle import index_quiz, unindex_quiz, open_quizzes
+from schedules import EMAIL_SCHEDULES, add_schedules, ensure_schedules, set_send_hour, serialize_schedule
+
+api = Blueprint('api', __name__)
+jwt = JWTManager()
 celery = workers.celery
 
-celery.conf.update(
-    broker_url='redis://localhost:6379/1',
-    result_backend='redis://localhost:6379/2'
-)
+def create_app(config=None):
+    """ Build the Flask application; `config` overrides the defaults below """
+    app = Flask(__name__)
+
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_uri(os.environ.get('DATABASE_URL', 'sqlite:///quizmaster.db'))
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    # Connection pool, used for server databases (e.g. DATABASE_URL=postgresql://...)
+    app.config['DATABASE_POOL_SIZE'] = int(os.environ.get('DATABASE_POOL_SIZE', 10))
+    app.config['DATABASE_MAX_OVERFLOW'] = int(os.environ.get('DATABASE_MAX_OVERFLOW', 20))
+    app.config['DATABASE_POOL_PRE_PING'] = os.environ.get('DATABASE_POOL_PRE_PING', '1') == '1'
+    app.config['DATABASE_POOL_RECYCLE'] = int(os.environ.get('DATABASE_POOL_RECYCLE', 1800))
+    # SQLite tuning, see database.init_app
+    app.config['SQLITE_WAL'] = os.environ.get('SQLITE_WAL', '1') == '1'
+    app.config['SQLITE_BUSY_TIMEOUT_MS'] = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000))
+
+    app.config['JWT_SECRET_KEY'] = 'super-secret'
+
+    # Password hashing cost; existing hashes are upgraded on the next login when it changes
+    app.config['BCRYPT_LOG_ROUNDS'] = int(os.environ.get('BCRYPT_LOG_ROUNDS', 12))
+    app.config['PASSWORD_HASH_WORKERS'] = int(os.environ.get('PASSWORD_HASH_WORKERS', 2))
+
+    # MailHog Configuration
+    app.config['MAIL_SERVER'] = 'localhost'
+    app.config['MAIL_PORT'] = 1025
+    app.config['MAIL_USE_TLS'] = False
+    app.config['MAIL_USE_SSL'] = False
+    app.config['MAIL_DEFAULT_SENDER'] = 'quizme@example.com'
+    # Default UTC hour of the scheduled emails; users can pick their own, see schedules.py
+    app.config['EMAIL_SEND_HOUR'] = int(os.environ.get('EMAIL_SEND_HOUR', 10))
+
+    app.config['CACHE_TYPE'] = os.environ.get('CACHE_TYPE', 'redis')
+    app.config['CACHE_REDIS_URL'] = 'redis://localhost:6379/0'
+
+    app.config['CELERY_BROKER_URL'] = 'redis://localhost:6379/1'
+    app.config['CELERY_RESULT_BACKEND'] = 'redis://localhost:6379/2'
+
+    # 'queued' acknowledges graded submissions at once and writes them from a worker, see submissions.py
+    app.config['SUBMISSION_MODE'] = os.environ.get('SUBMISSION_MODE', 'sync')
+
+    app.config.update(config or {})
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(app.config))
 
-celery.Task = workers.ContextTask
-app.app_context().push()
+    # Initialize extensions
+    db.init_app(app)
+    database.init_app(app)
+    jwt.init_app(app)
+
+    # Enable CORS for all routes with proper configuration
+    CORS(app, 
+         resources={
+             r"/*": {
+                 "origins": "http://localhost:8080",
+                 "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
+                 "allow_headers": ["Content-Type", "Authorization", "Idempotency-Key", "If-None-Match"],
+                 "supports_credentials": True,
+                 "expose_headers": ["Content-Type", "Authorization", "X-Next-Cursor", "ETag"]
+             }
+         })
+
+    mail.init_app(app)
+    cache.init_app(app)
+    workers.init_app(app)
+    auth.init_app(app)
+
+    app.register_blueprint(api)
+    app.cli.command('init-db')(init_db_command)
+    app.cli.command('rebuild-rollups')(rebuild_rollups_command)
+    app.cli.command('remove-duplicates')(remove_duplicates_command)
+    return app
 
 def create_admin():
     admin = User.query.filter_by(role='admin').first()
@@ -70,12 +110,39 @@ def create_admin():
         db.session.add(admin)
         db.session.commit()
 
-with app.app_context(): 
+def bootstrap_db():
+    """Create missing tables and indexes, backfill rollups and email schedules and make sure the admin exists"""
     db.create_all()
+    upgrade_schema()
+    ensure_rollups()
+    ensure_schedules(datetime.utcnow())
     create_admin()
 
+def init_db_command():
+    """Create or upgrade the database schema and the admin account"""
+    bootstrap_db()
+    print("Database is up to date")
+
+def remove_duplicates_command():
+    """Delete the rows that block a new unique index, keeping the oldest of each, and create the indexes"""
+    removed = remove_duplicates()
+    for table_name, count in removed.items():
+        print(f"Removed {count} duplicate rows from {table_name}")
+    if 'scores' in removed:
+        rebuild_rollups()
+        db.session.commit()
+        print("Rebuilt the score rollups")
+    created = upgrade_schema()
+    print(f"Created {', '.join(created)}" if created else "Database is up to date")
+
+def rebuild_rollups_command():
+    """Recompute the score rollup tables from the scores table"""
+    rebuild_rollups()
+    db.session.commit()
+    print(f"Rebuilt rollups for {UserStats.query.count()} users and {SubjectStats.query.count()} subjects")
+
 # Auth Routes
-@app.route('/register', methods=['POST'])
+@api.route('/register', methods=['POST'])
 def register():
     data = request.get_json()
 
@@ -101,12 +168,16 @@ def register():
             dob=dob
         )
         db.session.add(new_user)
+        db.session.flush()
+        add_schedules(new_user.id, datetime.utcnow())
         db.session.commit()
+        bump_version('users')
+        publish_counts()
         return jsonify({"message": "User registered successfully"}), 201
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/login', methods=['POST'])
+@api.route('/login', methods=['POST'])
 def login():
     data = request.get_json()
     username = data.get('username')
@@ -117,7 +188,10 @@ def login():
     
     user = User.query.filter_by(username=username).first()
     
-    if user and bcrypt.check_password_hash(user.password, password):
+    if user and check_password_hash(user.password, password):
+        if needs_rehash(user.password):
+            user.password = generate_password_hash(password)
+            db.session.commit()
         access_token = create_access_token(identity={
             'id': user.id,
             'username': user.username,
@@ -131,13 +205,10 @@ def login():
     return jsonify({"error": "Invalid credentials"}), 401
 
 # Admin Routes
-@app.route('/subjects', methods=['GET', 'POST'])
+@api.route('/subjects', methods=['GET', 'POST'])
 @jwt_required()
+@admin_required
 def manage_subjects():
-    current_user = get_jwt_identity()
-    if current_user['role'] != 'admin':
-        return jsonify({"error": "Unauthorized"}), 403
-    
     if request.method == 'POST':
         data = request.get_json()
         if not data.get('name'):
@@ -150,31 +221,35 @@ def manage_subjects():
         try:
             db.session.add(new_subject)
             db.session.commit()
+            bump_version('subjects')
+            publish_counts()
             return jsonify({"message": "Subject created successfully"}), 201
         except Exception as e:
             return jsonify({"error": str(e)}), 500
     
     # GET method
-    subjects = Subject.query.all()
-    return jsonify([{
+    return list_response(Subject.query, Subject.id, lambda s: {
         'id': s.id,
         'name': s.name,
         'description': s.description
-    } for s in subjects]), 200
+    })
 
-@app.route('/subjects/<int:subject_id>', methods=['PUT', 'DELETE'])
+@api.route('/subjects/<int:subject_id>', methods=['PUT', 'DELETE'])
 @jwt_required()
+@admin_required
 def manage_subject(subject_id):
-    current_user = get_jwt_identity()
-    if current_user['role'] != 'admin':
-        return jsonify({"error": "Unauthorized"}), 403
-    
     subject = Subject.query.get_or_404(subject_id)
     
     if request.method == 'DELETE':
         try:
+            quiz_ids = [quiz.id for chapter in subject.chapters for quiz in chapter.quizzes]
+            # Scores go with it, so they come out of the rollups first
+            remove_quiz_scores(quiz_ids)
             db.session.delete(subject)
             db.session.commit()
+            bump_version('subjects', 'chapters', 'quizzes', 'questions', 'scores', *quiz_namespaces(quiz_ids))
+            unindex_quiz(*quiz_ids)
+            publish_counts()
             return jsonify({"message": "Subject deleted successfully"}), 200
         except Exception as e:
             return jsonify({"error": str(e)}), 500
@@ -188,12 +263,15 @@ def manage_subject(subject_id):
         subject.name = data['name']
         subject.description = data.get('description', subject.description)
         db.session.commit()
+        bump_version('subjects')
+        publish_counts()
         return jsonify({"message": "Subject updated successfully"}), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/subjects/<int:subject_id>', methods=['GET'])
+@api.route('/subjects/<int:subject_id>', methods=['GET'])
 @jwt_required()
+@cached_response('subjects')
 def get_subject(subject_id):
     subject = Subject.query.get_or_404(subject_id)
     return jsonify({
@@ -203,12 +281,12 @@ def get_subject(subject_id):
     }), 200
 
 # Chapter Routes
-@app.route('/subjects/<int:subject_id>/chapters', methods=['GET', 'POST'])
+@api.route('/subjects/<int:subject_id>/chapters', methods=['GET', 'POST'])
 @jwt_required()
+@cached_response('chapters')
 def manage_chapters(subject_id):
     if request.method == 'POST':
-        current_user = get_jwt_identity()
-        if current_user['role'] != 'admin':
+        if not is_admin():
             return jsonify({"error": "Unauthorized"}), 403
         
         data = request.get_json()
@@ -223,23 +301,23 @@ def manage_chapters(subject_id):
         try:
             db.session.add(new_chapter)
             db.session.commit()
+            bump_version('chapters')
+            publish_counts()
             return jsonify({"message": "Chapter created successfully"}), 201
         except Exception as e:
             return jsonify({"error": str(e)}), 500
     
     # GET method
-    chapters = Chapter.query.filter_by(subject_id=subject_id).all()
-    return jsonify([{
+    chapters = Chapter.query.filter_by(subject_id=subject_id)
+    return list_response(chapters, Chapter.id, lambda c: {
         'id': c.id,
         'name': c.name,
         'description': c.description
-    } for c in chapters]), 200
+    })
 
-@app.route('/chapters/<int:chapter_id>', methods=['GET', 'PUT', 'DELETE'])
+@api.route('/chapters/<int:chapter_id>', methods=['GET', 'PUT', 'DELETE'])
 @jwt_required()
 def manage_chapter(chapter_id):
-    current_user = get_jwt_identity()
-    
     # GET method
     if request.method == 'GET':
         chapter = Chapter.query.get_or_404(chapter_id)
@@ -251,15 +329,21 @@ def manage_chapter(chapter_id):
         }), 200
     
     # For PUT and DELETE methods, check admin authorization
-    if current_user['role'] != 'admin':
+    if not is_admin():
         return jsonify({"error": "Unauthorized"}), 403
     
     chapter = Chapter.query.get_or_404(chapter_id)
     
     if request.method == 'DELETE':
         try:
+            quiz_ids = [quiz.id for quiz in chapter.quizzes]
+            # Scores go with it, so they come out of the rollups first
+            remove_quiz_scores(quiz_ids)
             db.session.delete(chapter)
             db.session.commit()
+            bump_version('chapters', 'quizzes', 'questions', 'scores', *quiz_namespaces(quiz_ids))
+            unindex_quiz(*quiz_ids)
+            publish_counts()
             return jsonify({"message": "Chapter deleted successfully"}), 200
         except Exception as e:
             return jsonify({"error": str(e)}), 500
@@ -273,17 +357,20 @@ def manage_chapter(chapter_id):
         chapter.name = data['name']
         chapter.description = data.get('description', chapter.description)
         db.session.commit()
+        bump_version('chapters')
+        publish_counts()
         return jsonify({"message": "Chapter updated successfully"}), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 # Quiz Routes
-@app.route('/chapters/<int:chapter_id>/quizzes', methods=['GET', 'POST'])
+@api.route('/chapters/<int:chapter_id>/quizzes', methods=['GET', 'POST'])
 @jwt_required()
+# is_active/is_expired/is_upcoming change with the clock, hence the short timeout
+@cached_response('quizzes', timeout=60)
 def manage_quizzes(chapter_id):
     if request.method == 'POST':
-        current_user = get_jwt_identity()
-        if current_user['role'] != 'admin':
+        if not is_admin():
             return jsonify({"error": "Unauthorized"}), 403
         
         data = request.get_json()
@@ -318,6 +405,9 @@ def manage_quizzes(chapter_id):
             )
             db.session.add(new_quiz)
             db.session.commit()
+            bump_version('quizzes')
+            index_quiz(new_quiz)
+            publish_counts()
             return jsonify({"message": "Quiz created successfully", "quiz_id": new_quiz.id}), 201
         except ValueError as e:
             return jsonify({"error": "Invalid date format or time duration. Please check your input."}), 400
@@ -325,10 +415,9 @@ def manage_quizzes(chapter_id):
             return jsonify({"error": str(e)}), 500
     
     # GET method
-    quizzes = Quiz.query.filter_by(chapter_id=chapter_id).all()
-    now = datetime.utcnow()
+    quizzes = Quiz.query.filter_by(chapter_id=chapter_id)
     
-    return jsonify([{
+    return list_response(quizzes, Quiz.id, lambda q: {
         'id': q.id,
         'title': q.title,
         'description': q.description,
@@ -339,10 +428,11 @@ def manage_quizzes(chapter_id):
         'is_active': q.is_active,
         'is_expired': q.is_expired,
         'is_upcoming': q.is_upcoming
-    } for q in quizzes]), 200
+    })
 
-@app.route('/quizzes/<int:quiz_id>', methods=['GET'])
+@api.route('/quizzes/<int:quiz_id>', methods=['GET'])
 @jwt_required()
+@cached_response('quizzes')
 def get_quiz(quiz_id):
     quiz = Quiz.query.get_or_404(quiz_id)
     return jsonify({
@@ -356,19 +446,21 @@ def get_quiz(quiz_id):
         'chapter_id': quiz.chapter_id
     }), 200
 
-@app.route('/quizzes/<int:quiz_id>', methods=['PUT', 'DELETE'])
+@api.route('/quizzes/<int:quiz_id>', methods=['PUT', 'DELETE'])
 @jwt_required()
+@admin_required
 def manage_quiz(quiz_id):
-    current_user = get_jwt_identity()
-    if current_user['role'] != 'admin':
-        return jsonify({"error": "Unauthorized"}), 403
-    
     quiz = Quiz.query.get_or_404(quiz_id)
     
     if request.method == 'DELETE':
         try:
+            # Scores go with it, so they come out of the rollups first
+            remove_quiz_scores([quiz_id])
             db.session.delete(quiz)
             db.session.commit()
+            bump_version('quizzes', 'questions', 'scores', *quiz_namespaces([quiz_id]))
+            unindex_quiz(quiz_id)
+            publish_counts()
             return jsonify({"message": "Quiz deleted successfully"}), 200
         except Exception as e:
             return jsonify({"error": str(e)}), 500
@@ -403,108 +495,193 @@ def manage_quiz(quiz_id):
         quiz.status = data.get('status', quiz.status)
         
         db.session.commit()
+        bump_version('quizzes', *quiz_namespaces([quiz_id]))
+        index_quiz(quiz)
+        publish_counts()
         return jsonify({"message": "Quiz updated successfully"}), 200
     except ValueError as e:
         return jsonify({"error": "Invalid date format or time duration. Please check your input."}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/available-quizzes', methods=['GET'])
+def quiz_namespaces(quiz_ids):
+    """ The per-quiz cache namespaces of the given quizzes.
+
+    Answer keys and question lists only depend on their own quiz, so they are cached
+    under 'quiz:<id>' rather than 'quizzes', which every quiz write and expiry bumps.
+    """
+    return [f'quiz:{quiz_id}' for quiz_id in quiz_ids]
+
+@api.route('/available-quizzes', methods=['GET'])
 @jwt_required()
 def get_available_quizzes():
-    current_user = get_jwt_identity()
+    current_user = current_identity()
     now = datetime.utcnow()
     
     # Get all active quizzes that the user hasn't attempted yet
-    attempted_quiz_ids = [score.quiz_id for score in Score.query.filter_by(user_id=current_user['id']).all()]
+    attempted_quiz_ids = db.session.query(Score.quiz_id).filter(Score.user_id == current_user['id'])
+    
+    open_quiz_counts = open_quizzes(now)
+    if open_quiz_counts is not None:
+        # The Redis index already knows which quizzes are open and their question counts
+        quizzes = db.session.query(
+            Quiz,
+            Chapter.name,
+            Subject.name
+        ).join(Chapter, Chapter.id == Quiz.chapter_id).join(Subject, Subject.id == Chapter.subject_id).filter(
+            Quiz.id.in_(open_quiz_counts),
+            Quiz.id.notin_(attempted_quiz_ids)
+        )
+        return list_response(quizzes, Quiz.id, lambda row: serialize_available_quiz(
+            (*row, open_quiz_counts[row[0].id])
+        ))
     
-    available_quizzes = []
-    quizzes = Quiz.query.filter(
+    quizzes = db.session.query(
+        Quiz,
+        Chapter.name,
+        Subject.name,
+        question_count_column()
+    ).join(Chapter, Chapter.id == Quiz.chapter_id).join(Subject, Subject.id == Chapter.subject_id).filter(
         Quiz.id.notin_(attempted_quiz_ids),
         Quiz.status == 'active',
         Quiz.start_date <= now,
         Quiz.end_date >= now
-    ).all()
-    
-    for quiz in quizzes:
-        chapter = Chapter.query.get(quiz.chapter_id)
-        subject = Subject.query.get(chapter.subject_id)
-        
-        available_quizzes.append({
-            'id': quiz.id,
-            'title': quiz.title,
-            'subject': subject.name,
-            'chapter': chapter.name,
-            'start_date': quiz.start_date.isoformat(),
-            'end_date': quiz.end_date.isoformat(),
-            'time_duration': quiz.time_duration,
-            'total_questions': len(quiz.questions)
-        })
+    )
     
-    return jsonify(available_quizzes), 200
+    return list_response(quizzes, Quiz.id, serialize_available_quiz)
 
-@app.route('/quizzes/<int:quiz_id>/attempt', methods=['POST'])
+def serialize_available_quiz(row):
+    quiz, chapter_name, subject_name, total_questions = row
+    return {
+        'id': quiz.id,
+        'title': quiz.title,
+        'subject': subject_name,
+        'chapter': chapter_name,
+        'start_date': quiz.start_date.isoformat(),
+        'end_date': quiz.end_date.isoformat(),
+        'time_duration': quiz.time_duration,
+        'total_questions': total_questions
+    }
+
+def question_count_column():
+    """Correlated subquery counting the questions of the Quiz in the enclosing query"""
+    return db.select(db.func.count(Question.id)).where(
+        Question.quiz_id == Quiz.id
+    ).correlate(Quiz).scalar_subquery()
+
+@api.route('/quizzes/<int:quiz_id>/attempt', methods=['POST'])
 @jwt_required()
 def attempt_quiz(quiz_id):
-    current_user = get_jwt_identity()
+    current_user = current_identity()
+    # Clients may resend a submission with the same Idempotency-Key to get the original result
+    idempotency_key = request.headers.get('Idempotency-Key', '')[:64] or None
     
     # Check if quiz exists and is active
     quiz = Quiz.query.get_or_404(quiz_id)
     if not quiz.is_active:
-        return jsonify({"error": "This quiz is not currently active"}), 400
-    
-    # Check if user has already attempted this quiz
-    existing_attempt = Score.query.filter_by(
-        quiz_id=quiz_id,
-        user_id=current_user['id']
-    ).first()
-    
-    if existing_attempt:
-        return jsonify({"error": "You have already attempted this quiz"}), 400
+        return replay_submission(quiz_id, current_user['id'], idempotency_key) or (
+            jsonify({"error": "This quiz is not currently active"}), 400
+        )
 
     data = request.get_json()
     if not data.get('answers'):
         return jsonify({"error": "No answers provided"}), 400
     
-    questions = Question.query.filter_by(quiz_id=quiz_id).all()
-    total_questions = len(questions)
-    correct_answers = 0
-    
     # Calculate score
-    for question in questions:
-        user_answer = data['answers'].get(str(question.id))
-        if user_answer and user_answer == question.correct_option:
-            correct_answers += 1
-    
-    percentage = (correct_answers / total_questions * 100) if total_questions > 0 else 0
+    answer_key = get_answer_key(quiz_id)
+    total_questions = len(answer_key)
+    correct_answers = grade(answer_key, data['answers'])
     
     score = Score(
         quiz_id=quiz_id,
         user_id=current_user['id'],
+        time_stamp_of_attempt=datetime.utcnow(),
         total_scored=correct_answers,
-        total_questions=total_questions
+        total_questions=total_questions,
+        idempotency_key=idempotency_key
     )
+    if queued_submissions():
+        return queue_submission(score)
     
     try:
+        # The unique (quiz_id, user_id) index rejects a second attempt, so there is no
+        # separate check to race against
         db.session.add(score)
+        db.session.flush()
+    except IntegrityError:
+        db.session.rollback()
+        return replay_submission(quiz_id, current_user['id'], idempotency_key) or (
+            jsonify({"error": "You have already attempted this quiz"}), 400
+        )
+    
+    try:
+        record_attempt(score, quiz.chapter.subject_id)
         db.session.commit()
-        return jsonify({
-            "message": "Quiz submitted successfully",
-            "score": f"{correct_answers}/{total_questions}",
-            "percentage": round(percentage, 2)
-        }), 200
+        bump_version(f"scores:{current_user['id']}", 'attempts')
+        publish_attempts([score])
+        return submission_result(score), 200
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 500
+
+def replay_submission(quiz_id, user_id, idempotency_key):
+    """The original result of a resent submission, or None if it is not a retry"""
+    if not idempotency_key:
+        return None
+    score = Score.query.filter_by(quiz_id=quiz_id, user_id=user_id).first()
+    if score is None or score.idempotency_key != idempotency_key:
+        return None
+    return submission_result(score), 200
+
+def submission_result(score):
+    return jsonify({
+        "message": "Quiz submitted successfully",
+        **score_summary(score.total_scored, score.total_questions)
+    })
+
+def queue_submission(score):
+    """ Acknowledge a graded submission with 202 and leave the insert to the drain worker """
+    if Score.query.filter_by(quiz_id=score.quiz_id, user_id=score.user_id).first():
+        return replay_submission(score.quiz_id, score.user_id, score.idempotency_key) or (
+            jsonify({"error": "You have already attempted this quiz"}), 400
+        )
+    try:
+        status, result = enqueue_submission(score)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
+    if status == 'duplicate' or result['status'] == 'rejected':
+        return jsonify({"error": "You have already attempted this quiz"}), 400
+    return jsonify({
+        "message": "Quiz submitted successfully",
+        "status": result['status'],
+        "score": result['score'],
+        "percentage": result['percentage']
+    }), 202
+
+@api.route('/quizzes/<int:quiz_id>/attempt/status', methods=['GET'])
+@jwt_required()
+def attempt_status(quiz_id):
+    """ The caller's submission for a quiz: pending (queued, not yet written), recorded or rejected """
+    user_id = current_identity()['id']
+    result = get_result(quiz_id, user_id) if queued_submissions() else None
+    if result is None:
+        score = Score.query.filter_by(quiz_id=quiz_id, user_id=user_id).first()
+        if score is None:
+            return jsonify({"error": "No submission found"}), 404
+        result = {'status': 'recorded', **score_summary(score.total_scored, score.total_questions)}
+    result.pop('idempotency_key', None)
+    return jsonify(result), 200
 
 # Question Routes
-@app.route('/quizzes/<int:quiz_id>/questions', methods=['GET', 'POST'])
+@api.route('/quizzes/<int:quiz_id>/questions', methods=['GET', 'POST'])
 @jwt_required()
+@cached_response('quiz:{quiz_id}', 'questions:{quiz_id}')
 def manage_questions(quiz_id):
     if request.method == 'POST':
-        current_user = get_jwt_identity()
-        if current_user['role'] != 'admin':
+        if not is_admin():
             return jsonify({"error": "Unauthorized"}), 403
 
+        quiz = Quiz.query.get_or_404(quiz_id)
         data = request.get_json()
         if not data:
             return jsonify({"error": "No data provided"}), 400
@@ -530,6 +707,8 @@ def manage_questions(quiz_id):
             )
             db.session.add(new_question)
             db.session.commit()
+            bump_version('questions', f'questions:{quiz_id}')
+            index_quiz(quiz)
             return jsonify({"message": "Question added successfully"}), 201
         except ValueError:
             return jsonify({"error": "Correct option must be a number between 1 and 4"}), 400
@@ -537,124 +716,155 @@ def manage_questions(quiz_id):
             return jsonify({"error": str(e)}), 500
     
     # GET method
-    questions = Question.query.filter_by(quiz_id=quiz_id).all()
-    return jsonify([{
+    questions = Question.query.filter_by(quiz_id=quiz_id)
+    show_answers = is_admin()
+    return list_response(questions, Question.id, lambda q: {
         'id': q.id,
         'question_statement': q.question_statement,
         'option1': q.option1,
         'option2': q.option2,
         'option3': q.option3,
         'option4': q.option4,
-        'correct_option': q.correct_option if get_jwt_identity()['role'] == 'admin' else None
-    } for q in questions]), 200
+        'correct_option': q.correct_option if show_answers else None
+    })
+
+@api.route('/quizzes/<int:quiz_id>/questions/import', methods=['POST'])
+@jwt_required()
+@admin_required
+def import_quiz_questions(quiz_id):
+    quiz = Quiz.query.get_or_404(quiz_id)
+    file_format = import_format(request.mimetype, request.args.get('format'))
+    if not file_format:
+        return jsonify({"error": "Send questions as CSV (text/csv) or JSON Lines (application/x-ndjson)"}), 400
+    
+    try:
+        imported, errors = import_questions(quiz_id, iter_records(request.stream, file_format))
+    except UnicodeDecodeError:
+        db.session.rollback()
+        return jsonify({"error": "Questions must be UTF-8 encoded"}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 500
+    if errors:
+        return jsonify({"error": "No questions were imported", "details": errors}), 400
+    
+    bump_version('questions', f'questions:{quiz_id}')
+    index_quiz(quiz)
+    return jsonify({"message": f"{imported} questions imported successfully", "imported": imported}), 201
+
+@api.route('/quizzes/<int:quiz_id>/questions/export', methods=['GET'])
+@jwt_required()
+@admin_required
+def export_quiz_questions(quiz_id):
+    quiz = Quiz.query.get_or_404(quiz_id)
+    file_format = request.args.get('format', 'csv')
+    if file_format not in IMPORT_FORMATS:
+        return jsonify({"error": f"Format must be one of: {', '.join(IMPORT_FORMATS)}"}), 400
+    
+    return Response(
+        stream_with_context(export_questions(quiz.id, file_format)),
+        mimetype=IMPORT_FORMATS[file_format],
+        headers={'Content-Disposition': f'attachment; filename=quiz-{quiz.id}-questions.{file_format}'}
+    )
 
 # User Score Routes
-@app.route('/my-scores', methods=['GET'])
+@api.route('/my-scores', methods=['GET'])
 @jwt_required()
+@cached_response('subjects', 'chapters', 'quizzes', 'scores', 'scores:{user_id}', per_user=True)
 def get_user_scores():
-    current_user = get_jwt_identity()
-    scores = Score.query.filter_by(user_id=current_user['id']).all()
-    
-    score_data = []
-    for score in scores:
-        quiz = Quiz.query.get(score.quiz_id)
-        chapter = Chapter.query.get(quiz.chapter_id)
-        subject = Subject.query.get(chapter.subject_id)
-        
-        score_data.append({
-            'subject': subject.name,
-            'chapter': chapter.name,
-            'quiz_title': quiz.title,
-            'score': f"{score.total_scored}/{score.total_questions}",
-            'percentage': (score.total_scored / score.total_questions) * 100,
-            'attempt_time': score.time_stamp_of_attempt.strftime('%Y-%m-%d %H:%M:%S')
-        })
+    current_user = current_identity()
+    scores = db.session.query(
+        Score,
+        Quiz.title,
+        Chapter.name,
+        Subject.name
+    ).join(Quiz, Quiz.id == Score.quiz_id).join(Chapter, Chapter.id == Quiz.chapter_id).join(
+        Subject, Subject.id == Chapter.subject_id
+    ).filter(Score.user_id == current_user['id'])
     
-    return jsonify(score_data), 200
+    return list_response(scores, Score.id, serialize_score)
 
-@app.route('/admin/dashboard-stats', methods=['GET'])
+def serialize_score(row):
+    score, quiz_title, chapter_name, subject_name = row
+    return {
+        'subject': subject_name,
+        'chapter': chapter_name,
+        'quiz_title': quiz_title,
+        'score': f"{score.total_scored}/{score.total_questions}",
+        'percentage': (score.total_scored / score.total_questions) * 100,
+        'attempt_time': score.time_stamp_of_attempt.strftime('%Y-%m-%d %H:%M:%S')
+    }
+
+@api.route('/admin/dashboard-stats', methods=['GET'])
 @jwt_required()
-@cache.cached(timeout=180)
+@admin_required
 def get_dashboard_stats():
-    current_user = get_jwt_identity()
-    if current_user['role'] != 'admin':
-        return jsonify({"error": "Unauthorized"}), 403
-    
+    """ Dashboard counts and recent activity for the admin's 30 second poll.
+
+    The ETag changes only when the underlying data does, so an unchanged poll is a 304.
+    With ?since=<score id>, recentActivity holds only the attempts newer than that score.
+    """
+    since = request.args.get('since', type=int)
     try:
-        # Get total subjects
-        total_subjects = Subject.query.count()
-        
-        # Get total chapters
-        total_chapters = Chapter.query.count()
-        
-        # Get active quizzes
-        now = datetime.utcnow()
-        active_quizzes = Quiz.query.filter(
-            Quiz.status == 'active',
-            Quiz.start_date <= now,
-            Quiz.end_date >= now
-        ).count()
-        
-        # Get total users (excluding admin)
-        total_users = User.query.filter(User.role != 'admin').count()
-        
-        # Get latest subject
-        latest_subject = Subject.query.order_by(Subject.id.desc()).first()
-        latest_subject_data = None
-        if latest_subject:
-            latest_subject_data = {
-                'id': latest_subject.id,
-                'name': latest_subject.name
-            }
-        
-        # Get latest chapter
-        latest_chapter = Chapter.query.order_by(Chapter.id.desc()).first()
-        latest_chapter_data = None
-        if latest_chapter:
-            latest_chapter_data = {
-                'id': latest_chapter.id,
-                'name': latest_chapter.name
-            }
-        
-        # Get recent activity
-        recent_scores = Score.query.order_by(Score.time_stamp_of_attempt.desc()).limit(5).all()
-        recent_activity = []
-        
-        for score in recent_scores:
-            user = User.query.get(score.user_id)
-            quiz = Quiz.query.get(score.quiz_id)
-            chapter = Chapter.query.get(quiz.chapter_id)
-            subject = Subject.query.get(chapter.subject_id)
-            
-            recent_activity.append({
-                'id': score.id,
-                'icon': 'fas fa-check-circle text-success',
-                'text': f"{user.full_name} completed quiz '{quiz.title}' with score {score.total_scored}/{score.total_questions}",
-                'timestamp': score.time_stamp_of_attempt.isoformat()
-            })
-        
-        return jsonify({
-            'stats': {
-                'subjects': total_subjects,
-                'chapters': total_chapters,
-                'activeQuizzes': active_quizzes,
-                'users': total_users
-            },
-            'latestSubject': latest_subject_data,
-            'latestChapter': latest_chapter_data,
-            'recentActivity': recent_activity
-        }), 200
+        # Quizzes open and close with the clock as well as with writes, so the active
+        # count is part of the ETag
+        active_quizzes = active_quiz_count()
+        etag = version_etag(DASHBOARD_NAMESPACES, active_quizzes, since)
+        if etag in request.if_none_match:
+            response = make_response('', 304)
+        else:
+            # Shared by every admin tab polling with the same ETag
+            key = f'dashboard:{etag}'
+            body = cache.get(key)
+            if body is None:
+                body = jsonify(dashboard_stats(active_quizzes, since)).get_data()
+                cache.set(key, body)
+            response = make_response(body)
+            response.mimetype = 'application/json'
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/admin/statistics', methods=['GET'])
+DASHBOARD_NAMESPACES = ('subjects', 'chapters', 'quizzes', 'users', 'attempts', 'scores')
+
+@api.route('/admin/activity/stream', methods=['GET'])
+@jwt_required(locations=['headers', 'query_string'])
+@admin_required
+def admin_activity_stream():
+    """ Server-sent events for the admin dashboard: new attempts, counters and resync hints.
+
+    EventSource cannot set headers, so the token may also come as ?jwt=<token>.
+    """
+    return Response(stream_activity(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+def dashboard_stats(active_quizzes, since=None):
+    # Get recent activity, or only what is new since the client's last poll
+    recent_scores = db.session.query(
+        Score,
+        User.full_name,
+        Quiz.title
+    ).join(User, User.id == Score.user_id).join(Quiz, Quiz.id == Score.quiz_id)
+    if since is not None:
+        recent_scores = recent_scores.filter(Score.id > since).order_by(Score.id.desc())
+    else:
+        recent_scores = recent_scores.order_by(Score.time_stamp_of_attempt.desc())
+    recent_activity = []
+    
+    for score, full_name, quiz_title in recent_scores.limit(5).all():
+        recent_activity.append(serialize_activity(score, full_name, quiz_title))
+    
+    return {**dashboard_summary(active_quizzes), 'recentActivity': recent_activity}
+
+@api.route('/admin/statistics', methods=['GET'])
 @jwt_required()
-@cache.cached(timeout=180)
+@admin_required
+@cached_response('subjects', 'chapters', 'quizzes', 'questions', 'users', 'attempts', 'scores', timeout=180)
 def get_admin_statistics():
-    current_user = get_jwt_identity()
-    if current_user['role'] != 'admin':
-        return jsonify({"error": "Unauthorized"}), 403
-    
     try:
         # Get various statistics
         total_users = User.query.filter(User.role != 'admin').count()
@@ -662,31 +872,17 @@ def get_admin_statistics():
         total_chapters = Chapter.query.count()
         total_quizzes = Quiz.query.count()
         total_questions = Question.query.count()
-        total_attempts = Score.query.count()
+        total_attempts = db.session.query(db.func.coalesce(db.func.sum(SubjectStats.attempts), 0)).scalar()
 
         # Get quiz completion rate
         active_quizzes = Quiz.query.filter(Quiz.status == 'active').count()
         completed_quizzes = Quiz.query.filter(Quiz.status == 'expired').count()
         
         # Get average scores by subject
-        subjects_data = []
-        subjects = Subject.query.all()
-        for subject in subjects:
-            chapters = Chapter.query.filter_by(subject_id=subject.id).all()
-            chapter_ids = [chapter.id for chapter in chapters]
-            quizzes = Quiz.query.filter(Quiz.chapter_id.in_(chapter_ids)).all()
-            quiz_ids = [quiz.id for quiz in quizzes]
-            scores = Score.query.filter(Score.quiz_id.in_(quiz_ids)).all()
-            
-            if scores:
-                avg_score = sum(score.total_scored / score.total_questions * 100 for score in scores) / len(scores)
-            else:
-                avg_score = 0
-                
-            subjects_data.append({
-                'name': subject.name,
-                'average_score': round(avg_score, 2)
-            })
+        subjects_data = [{
+            'name': name,
+            'average_score': round(avg_score, 2)
+        } for name, avg_score, attempts in subject_performance()]
 
         stats = {
             "total_users": total_users,
@@ -704,65 +900,128 @@ def get_admin_statistics():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/user/statistics', methods=['GET'])
+@api.route('/user/statistics', methods=['GET'])
 @jwt_required()
+@cached_response('subjects', 'quizzes', 'scores', 'scores:{user_id}', per_user=True)
 def get_user_statistics():
-    current_user = get_jwt_identity()
+    current_user = current_identity()
     try:
-        # Get user's quiz attempts
-        user_scores = Score.query.filter_by(user_id=current_user['id']).all()
-        
-        # Calculate total attempts and average score
-        total_attempts = len(user_scores)
-        if total_attempts > 0:
-            average_score = sum(score.total_scored / score.total_questions * 100 for score in user_scores) / total_attempts
-        else:
-            average_score = 0
+        # Get user's quiz attempts and average score
+        user_stats = db.session.get(UserStats, current_user['id'])
+        total_attempts = user_stats.attempts if user_stats else 0
+        average_score = user_stats.average_percentage if user_stats else 0
         
         # Get performance by subject
-        subjects_data = []
-        subjects = Subject.query.all()
-        for subject in subjects:
-            chapters = Chapter.query.filter_by(subject_id=subject.id).all()
-            chapter_ids = [chapter.id for chapter in chapters]
-            quizzes = Quiz.query.filter(Quiz.chapter_id.in_(chapter_ids)).all()
-            quiz_ids = [quiz.id for quiz in quizzes]
-            scores = Score.query.filter(Score.quiz_id.in_(quiz_ids), Score.user_id == current_user['id']).all()
-            
-            if scores:
-                avg_score = sum(score.total_scored / score.total_questions * 100 for score in scores) / len(scores)
-                attempts = len(scores)
-            else:
-                avg_score = 0
-                attempts = 0
-                
-            subjects_data.append({
-                'name': subject.name,
-                'average_score': round(avg_score, 2),
-                'attempts': attempts
-            })
+        subjects_data = [{
+            'name': name,
+            'average_score': round(avg_score, 2),
+            'attempts': attempts
+        } for name, avg_score, attempts in subject_performance(current_user['id'])]
         
-        # Get recent performance trend (last 5 attempts)
-        recent_scores = Score.query.filter_by(user_id=current_user['id']).order_by(Score.time_stamp_of_attempt.desc()).limit(5).all()
-        performance_trend = []
-        for score in recent_scores:
-            quiz = Quiz.query.get(score.quiz_id)
-            performance_trend.append({
-                'quiz_title': quiz.title,
-                'score': round((score.total_scored / score.total_questions * 100), 2),
-                'date': score.time_stamp_of_attempt.strftime('%Y-%m-%d')
-            })
-
         stats = {
             "total_attempts": total_attempts,
             "average_score": round(average_score, 2),
             "subjects_performance": subjects_data,
-            "performance_trend": performance_trend
+            "performance_trend": performance_trend(current_user['id'])
         }
 
         return jsonify(stats), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@api.route('/admin/statistics/chart', methods=['GET'])
+@jwt_required()
+@admin_required
+def get_admin_statistics_chart():
+    chart_format = request.args.get('format', 'png')
+    if chart_format not in CHART_FORMATS:
+        return jsonify({"error": f"Format must be one of: {', '.join(CHART_FORMATS)}"}), 400
+    
+    data = {
+        'subjects_performance': [{
+            'name': name,
+            'average_score': round(avg_score, 2)
+        } for name, avg_score, attempts in subject_performance()]
+    }
+    return chart_response('admin_statistics', data, chart_format)
+
+@api.route('/user/statistics/chart', methods=['GET'])
+@jwt_required()
+def get_user_statistics_chart():
+    current_user = current_identity()
+    
+    chart_format = request.args.get('format', 'png')
+    if chart_format not in CHART_FORMATS:
+        return jsonify({"error": f"Format must be one of: {', '.join(CHART_FORMATS)}"}), 400
+    
+    data = {
+        'subjects_performance': [{
+            'name': name,
+            'average_score': round(avg_score, 2)
+        } for name, avg_score, attempts in subject_performance(current_user['id'])],
+        # Oldest first so the trend reads left to right
+        'performance_trend': performance_trend(current_user['id'])[::-1]
+    }
+    return chart_response('user_statistics', data, chart_format)
+
+@api.route('/user/email-schedule', methods=['GET', 'PUT'])
+@jwt_required()
+def user_email_schedule():
+    """ The caller's scheduled emails; PUT {"daily_reminders": {"send_hour": 18}} moves a send window (UTC) """
+    current_user = current_identity()
+    
+    if request.method == 'PUT':
+        data = request.get_json() or {}
+        for kind, settings in data.items():
+            if kind not in EMAIL_SCHEDULES:
+                return jsonify({"error": f"Unknown email: {kind}"}), 400
+            send_hour = settings.get('send_hour') if isinstance(settings, dict) else None
+            if not isinstance(send_hour, int) or not 0 <= send_hour <= 23:
+                return jsonify({"error": "send_hour must be a whole hour between 0 and 23"}), 400
+        try:
+            now = datetime.utcnow()
+            for kind, settings in data.items():
+                set_send_hour(current_user['id'], kind, settings['send_hour'], now)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({"error": str(e)}), 500
+    
+    schedules = EmailSchedule.query.filter_by(user_id=current_user['id']).all()
+    return jsonify({schedule.kind: serialize_schedule(schedule) for schedule in schedules}), 200
+
+def performance_trend(user_id, limit=5):
+    """The user's most recent attempts, newest first"""
+    recent_scores = db.session.query(Score, Quiz.title).join(Quiz, Quiz.id == Score.quiz_id).filter(
+        Score.user_id == user_id
+    ).order_by(Score.time_stamp_of_attempt.desc()).limit(limit).all()
+    return [{
+        'quiz_title': quiz_title,
+        'score': round((score.total_scored / score.total_questions * 100), 2),
+        'date': score.time_stamp_of_attempt.strftime('%Y-%m-%d')
+    } for score, quiz_title in recent_scores]
+
+def subject_performance(user_id=None):
+    """(subject name, average percentage, attempts) for every subject, read from the rollups.
+
+    Subjects without attempts are reported with 0. Pass user_id to only count that user's scores.
+    """
+    if user_id is None:
+        stats_model, join_on = SubjectStats, SubjectStats.subject_id == Subject.id
+    else:
+        stats_model = UserSubjectStats
+        join_on = db.and_(UserSubjectStats.subject_id == Subject.id, UserSubjectStats.user_id == user_id)
+    
+    rows = db.session.query(
+        Subject.name,
+        db.func.coalesce(stats_model.percentage_sum, 0),
+        db.func.coalesce(stats_model.attempts, 0)
+    ).outerjoin(stats_model, join_on).order_by(Subject.id).all()
+    return [(name, percentage_sum / attempts if attempts else 0, attempts) for name, percentage_sum, attempts in rows]
+
+app = create_app()
+
 if __name__ == '__main__':
+    with app.app_context():
+        bootstrap_db()
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,28 @@
+from functools import wraps
+from flask import g, jsonify
+from flask_jwt_extended import get_jwt_identity
+
+def init_app(app):
+    app.before_request(reset_identity)
+
+def reset_identity():
+    g.pop('current_identity', None)
+
+def current_identity():
+    """ The JWT identity of the current request, looked up once and kept on flask.g """
+    identity = g.get('current_identity')
+    if identity is None:
+        identity = g.current_identity = get_jwt_identity()
+    return identity
+
+def is_admin():
+    return current_identity()['role'] == 'admin'
+
+def admin_required(view):
+    """ Reject non-admin callers with 403; goes below @jwt_required() """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not is_admin():
+            return jsonify({"error": "Unauthorized"}), 403
+        return view(*args, **kwargs)
+    return wrapper
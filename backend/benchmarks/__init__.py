@@ -0,0 +1,30 @@
+""" Load benchmarks for the API routes and Celery tasks.
+
+Run from the backend directory, e.g.
+
+    python -m benchmarks --users 2000 --scores 20000 --requests 500 --concurrency 16
+
+A synthetic dataset is generated into a scratch SQLite database (or --database-url),
+every scenario is run through Flask's test client from a thread pool (or --processes
+worker processes) and the results are printed and saved as JSON. Pass --compare with
+an earlier results file to see the change per scenario. The 'startup' task times
+fresh web (import app) and worker (celery -A app.celery) processes under
+python -X importtime and records their max RSS; run it alone with --scenarios ''
+--tasks startup.
+
+The 'questions' task imports QUESTION_COUNT (1000) questions into a new quiz through
+the CSV import endpoint and times listing them as the admin and as a student.
+
+The 'submission_concurrency' task runs the attempt scenario against fresh SQLite
+databases with the rollback journal and with WAL, plus --server-database-url when
+given, and reports each one's throughput, p95 latency and errors, e.g.
+
+    python -m benchmarks --scenarios '' --tasks submission_concurrency --requests 400 \
+        --concurrency 32 --server-database-url postgresql://localhost/quizme_bench
+
+Read-only scenarios also report the peak Python memory of one uncached request, so
+the statistics endpoints can be checked on a large dataset, e.g.
+
+    python -m benchmarks --users 20000 --scores 1000000 --tasks '' \
+        --scenarios user_statistics,admin_statistics,my_scores
+"""
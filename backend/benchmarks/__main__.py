@@ -0,0 +1,121 @@
+import argparse
+import json
+import os
+import tempfile
+from models import db, User
+from benchmarks import datagen, runner
+from benchmarks.scenarios import SCENARIOS, new_rng
+from benchmarks.tasks import TASKS
+
+def parse_args():
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description="Load benchmarks for the Quizme API")
+    dataset = parser.add_argument_group('dataset')
+    dataset.add_argument('--users', type=int, default=datagen.DEFAULT_SIZES['users'])
+    dataset.add_argument('--subjects', type=int, default=datagen.DEFAULT_SIZES['subjects'])
+    dataset.add_argument('--chapters-per-subject', type=int, default=datagen.DEFAULT_SIZES['chapters_per_subject'])
+    dataset.add_argument('--quizzes-per-chapter', type=int, default=datagen.DEFAULT_SIZES['quizzes_per_chapter'])
+    dataset.add_argument('--questions-per-quiz', type=int, default=datagen.DEFAULT_SIZES['questions_per_quiz'])
+    dataset.add_argument('--scores', type=int, default=datagen.DEFAULT_SIZES['scores'])
+    dataset.add_argument('--seed', type=int, default=0)
+
+    load = parser.add_argument_group('load')
+    load.add_argument('--requests', type=int, default=200, help="requests per scenario")
+    load.add_argument('--concurrency', type=int, default=16, help="concurrent requests in total")
+    load.add_argument('--processes', type=int, default=0, help="spread the requests over this many worker processes")
+    load.add_argument('--scenarios', default=','.join(SCENARIOS), help="comma separated, default all")
+    load.add_argument('--tasks', default=','.join(TASKS), help="comma separated, '' for none")
+    load.add_argument('--emails', type=int, default=100000, help="emails the render_emails task renders")
+
+    app = parser.add_argument_group('application')
+    app.add_argument('--database-url', help="an empty database; default a scratch SQLite file")
+    app.add_argument('--cache-type', default='SimpleCache', help="Flask-Caching backend, e.g. NullCache")
+    app.add_argument('--submission-mode', default='sync', choices=['sync', 'queued'])
+    app.add_argument('--bcrypt-rounds', type=int, default=4)
+    app.add_argument('--password-workers', type=int, default=0)
+    app.add_argument('--redis-url', help="real Redis for the index and queues; default fakeredis if installed")
+    app.add_argument('--sqlite-wal', action=argparse.BooleanOptionalAction, default=True,
+                     help="WAL journaling for SQLite databases, default on")
+    app.add_argument('--server-database-url',
+                     help="an empty server database (e.g. postgresql://...) to add to the submission_concurrency task")
+
+    parser.add_argument('--output', default='benchmark-results.json')
+    parser.add_argument('--compare', help="an earlier results file to compare with")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    scratch = None
+    database_url = args.database_url
+    if not database_url:
+        scratch = tempfile.mkdtemp(prefix='quizme-bench-')
+        database_url = f"sqlite:///{os.path.join(scratch, 'bench.db')}"
+    settings = {
+        'database_url': database_url,
+        'cache_type': args.cache_type,
+        'submission_mode': args.submission_mode,
+        'bcrypt_rounds': args.bcrypt_rounds,
+        'password_workers': args.password_workers,
+        'redis_url': args.redis_url,
+        'sqlite_wal': args.sqlite_wal,
+    }
+    app = runner.create_bench_app(**settings)
+
+    with app.app_context():
+        db.create_all()
+        if db.session.query(User.id).first():
+            raise SystemExit("The benchmark database must be empty")
+        counter = runner.StatementCounter(db.engine)
+        dataset = datagen.generate({
+            'users': args.users,
+            'subjects': args.subjects,
+            'chapters_per_subject': args.chapters_per_subject,
+            'quizzes_per_chapter': args.quizzes_per_chapter,
+            'questions_per_quiz': args.questions_per_quiz,
+            'scores': args.scores,
+        }, seed=args.seed, password_rounds=args.bcrypt_rounds)
+    redis_ready = runner.prepare_redis(app)
+    print(f"Dataset: {dataset}; Redis index {'built' if redis_ready else 'unavailable, SQL fallbacks in use'}")
+    if args.processes and not args.redis_url:
+        print("Note: without --redis-url every worker process has its own fakeredis, "
+              "so queued submissions are not visible to the drain_submissions task")
+
+    results = {
+        'meta': {**runner.environment(), 'options': vars(args), 'dataset': dataset, 'redis_index': redis_ready},
+        'scenarios': {},
+        'tasks': {},
+    }
+    pool = runner.process_pool(args.processes, settings) if args.processes else None
+    try:
+        for name in filter(None, args.scenarios.split(',')):
+            plan = SCENARIOS[name][0]
+            with app.app_context():
+                items = plan(args.requests, new_rng(args.seed, name))
+                if pool:
+                    result = runner.run_scenario_in_processes(pool, args.processes, name, items, args.concurrency)
+                else:
+                    result = runner.run_scenario(app, counter, name, items, args.concurrency)
+            result.update(runner.measure_memory(app, name, items))
+            results['scenarios'][name] = result
+            latency = result['latency_ms']
+            memory = f"  peak {result['peak_request_memory_kb']} KB/request" if 'peak_request_memory_kb' in result else ''
+            print(f"{name:<18} {result['throughput_rps']:>8} req/s  p50 {latency['p50']} ms  p95 {latency['p95']} ms"
+                  f"  p99 {latency['p99']} ms  {result['statements_per_request']} statements/request"
+                  f"  {result['errors']} errors{memory}")
+    finally:
+        if pool:
+            pool.shutdown()
+
+    for name in filter(None, args.tasks.split(',')):
+        with app.app_context():
+            results['tasks'][name] = TASKS[name](counter, args)
+        print(f"{name:<18} {results['tasks'][name]}")
+
+    runner.save_results(results, args.output)
+    print(f"Results saved to {args.output}")
+    if args.compare:
+        with open(args.compare) as previous:
+            for line in runner.compare_results(json.load(previous), results):
+                print(line)
+
+if __name__ == '__main__':
+    main()
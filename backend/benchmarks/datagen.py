@@ -0,0 +1,135 @@
+import random
+from datetime import datetime, timedelta
+from models import *
+from passwords import hash_password
+from rollups import rebuild_rollups
+from schedules import ensure_schedules
+
+DEFAULT_SIZES = {
+    'users': 1000,
+    'subjects': 5,
+    'chapters_per_subject': 4,
+    'quizzes_per_chapter': 5,
+    'questions_per_quiz': 20,
+    'scores': 10000,
+}
+BENCHMARK_PASSWORD = 'benchmark'
+INSERT_BATCH_SIZE = 5000
+
+# Quiz mix: most quizzes are open, some have ended and a few have not started yet.
+OPEN_SHARE = 0.6
+EXPIRED_SHARE = 0.3
+
+def generate(sizes=None, seed=0, now=None, password_rounds=4):
+    """ Fill an empty database with a synthetic dataset and return the row counts.
+
+    The same sizes and seed always produce the same rows; dates are relative to `now`.
+    Rows are inserted with executemany batches rather than through the ORM, and every
+    user shares one password hash of BENCHMARK_PASSWORD made with `password_rounds`.
+    """
+    sizes = {**DEFAULT_SIZES, **(sizes or {})}
+    rng = random.Random(seed)
+    now = now or datetime.utcnow()
+    password_hash = hash_password(BENCHMARK_PASSWORD, password_rounds)
+
+    insert(User, [{
+        'username': f'user{index}@bench.test',
+        'password': password_hash,
+        'full_name': f'Bench User {index}',
+        'qualification': rng.choice(['B.Sc', 'M.Sc', 'B.Tech', 'PhD']),
+        'dob': datetime(1980, 1, 1).date() + timedelta(days=rng.randrange(9000)),
+        'role': 'user',
+    } for index in range(sizes['users'])])
+    insert(User, [{
+        'username': 'admin@bench.test',
+        'password': password_hash,
+        'full_name': 'Bench Admin',
+        'qualification': 'PhD',
+        'dob': datetime(1980, 1, 1).date(),
+        'role': 'admin',
+    }])
+
+    insert(Subject, [{
+        'name': f'Subject {index}',
+        'description': f'Synthetic subject {index}',
+    } for index in range(sizes['subjects'])])
+    subject_ids = ids(Subject)
+    insert(Chapter, [{
+        'subject_id': subject_id,
+        'name': f'Chapter {subject_id}.{index}',
+        'description': '',
+    } for subject_id in subject_ids for index in range(sizes['chapters_per_subject'])])
+    chapter_ids = ids(Chapter)
+
+    quizzes = []
+    for chapter_id in chapter_ids:
+        for index in range(sizes['quizzes_per_chapter']):
+            kind = rng.random()
+            if kind < OPEN_SHARE:
+                start, end, status = now - timedelta(days=rng.randint(1, 20)), now + timedelta(days=rng.randint(1, 20)), 'active'
+            elif kind < OPEN_SHARE + EXPIRED_SHARE:
+                start, end, status = now - timedelta(days=rng.randint(30, 60)), now - timedelta(days=rng.randint(1, 29)), 'expired'
+            else:
+                start, end, status = now + timedelta(days=rng.randint(1, 10)), now + timedelta(days=rng.randint(11, 30)), 'active'
+            quizzes.append({
+                'chapter_id': chapter_id,
+                'title': f'Quiz {chapter_id}.{index}',
+                'description': '',
+                'start_date': start,
+                'end_date': end,
+                'time_duration': rng.choice([10, 15, 30]),
+                'status': status,
+            })
+    insert(Quiz, quizzes)
+    quiz_rows = db.session.query(Quiz.id, Quiz.start_date).order_by(Quiz.id).all()
+
+    insert(Question, [{
+        'quiz_id': quiz_id,
+        'question_statement': f'Synthetic question {index} of quiz {quiz_id}?',
+        'option1': 'Option A',
+        'option2': 'Option B',
+        'option3': 'Option C',
+        'option4': 'Option D',
+        'correct_option': rng.randint(1, 4),
+    } for quiz_id, start in quiz_rows for index in range(sizes['questions_per_quiz'])])
+
+    # Scores only for quizzes that have started, at most one per (quiz, user)
+    user_ids = ids(User, User.role == 'user')
+    started = [(quiz_id, start) for quiz_id, start in quiz_rows if start <= now]
+    wanted = min(sizes['scores'], int(len(user_ids) * len(started) * 0.8))
+    pairs = set()
+    while len(pairs) < wanted:
+        pairs.add((rng.randrange(len(started)), rng.choice(user_ids)))
+    scores = []
+    for quiz_index, user_id in sorted(pairs):
+        quiz_id, start = started[quiz_index]
+        total_questions = sizes['questions_per_quiz']
+        attempted_at = start + (now - start) * rng.random()
+        scores.append({
+            'quiz_id': quiz_id,
+            'user_id': user_id,
+            'time_stamp_of_attempt': attempted_at,
+            'total_scored': rng.randint(0, total_questions),
+            'total_questions': total_questions,
+        })
+    insert(Score, scores)
+
+    rebuild_rollups()
+    db.session.commit()
+    ensure_schedules(now)
+    return {
+        'users': len(user_ids),
+        'subjects': len(subject_ids),
+        'chapters': len(chapter_ids),
+        'quizzes': len(quiz_rows),
+        'questions': len(quiz_rows) * sizes['questions_per_quiz'],
+        'scores': len(scores),
+    }
+
+def insert(model, rows):
+    for start in range(0, len(rows), INSERT_BATCH_SIZE):
+        db.session.execute(model.__table__.insert(), rows[start:start + INSERT_BATCH_SIZE])
+    db.session.commit()
+
+def ids(model, *criteria):
+    return [row_id for row_id, in db.session.query(model.id).filter(*criteria).order_by(model.id)]
@@ -0,0 +1,223 @@
+import json
+import logging
+import math
+import multiprocessing
+import platform
+import subprocess
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from datetime import datetime
+from sqlalchemy import event
+from models import db
+from caching import cache
+from lifecycle import rebuild_quiz_index
+from benchmarks.scenarios import SCENARIOS, MEMORY_SCENARIOS
+
+MEMORY_SAMPLE = 5
+
+class StatementCounter:
+    """Counts the SQL statements an engine executes, across threads"""
+
+    def __init__(self, engine):
+        self.count = 0
+        self.lock = threading.Lock()
+        event.listen(engine, 'before_cursor_execute', self.increment)
+
+    def increment(self, *args):
+        with self.lock:
+            self.count += 1
+
+    def reset(self):
+        with self.lock:
+            self.count = 0
+
+def create_bench_app(database_url, cache_type='SimpleCache', submission_mode='sync',
+                     bcrypt_rounds=4, password_workers=0, redis_url=None, sqlite_wal=True, pool_size=10):
+    """ The application configured for benchmarking, with Redis or a fakeredis stand-in """
+    from app import create_app
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': database_url,
+        'SQLITE_WAL': sqlite_wal,
+        'DATABASE_POOL_SIZE': pool_size,
+        'CACHE_TYPE': cache_type,
+        'SUBMISSION_MODE': submission_mode,
+        'BCRYPT_LOG_ROUNDS': bcrypt_rounds,
+        'PASSWORD_HASH_WORKERS': password_workers,
+    })
+    # Fallback paths log a warning per request when there is no Redis at all
+    app.logger.setLevel(logging.ERROR)
+    if redis_url:
+        app.config['REDIS_URL'] = redis_url
+    else:
+        try:
+            import fakeredis
+        except ImportError:
+            pass
+        else:
+            app.extensions['redis'] = fakeredis.FakeRedis(decode_responses=True)
+    return app
+
+def prepare_redis(app):
+    """Build the active-quiz index the lifecycle task would maintain, if Redis is reachable"""
+    with app.app_context():
+        try:
+            rebuild_quiz_index(datetime.utcnow())
+            return True
+        except Exception:
+            return False
+
+def run_requests(app, execute, items, concurrency):
+    """ Make one request per plan item from `concurrency` threads; returns (latencies, errors) """
+    def timed(item):
+        with app.test_client() as client:
+            start = time.perf_counter()
+            status = execute(client, item)
+            return time.perf_counter() - start, status >= 400
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(timed, items))
+    return [latency for latency, failed in results], sum(failed for latency, failed in results)
+
+def run_scenario(app, counter, name, items, concurrency):
+    """Run a scenario's plan in this process and summarize it"""
+    execute = SCENARIOS[name][1]
+    counter.reset()
+    start = time.perf_counter()
+    latencies, errors = run_requests(app, execute, items, concurrency)
+    wall = time.perf_counter() - start
+    return summarize(latencies, errors, counter.count, wall)
+
+def measure_memory(app, name, items):
+    """ Peak Python memory of a single uncached request, over the first MEMORY_SAMPLE items.
+
+    Requests run one at a time under tracemalloc after the timed run, with the response
+    cache cleared first so each one renders its response. Only read-only scenarios are
+    measured, as the others cannot be replayed. Also reports the process's max RSS.
+    """
+    if name not in MEMORY_SCENARIOS:
+        return {}
+    execute = SCENARIOS[name][1]
+    peaks = []
+    tracemalloc.start()
+    try:
+        for item in items[:MEMORY_SAMPLE]:
+            with app.app_context():
+                cache.clear()
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+            with app.test_client() as client:
+                execute(client, item)
+            peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+    finally:
+        tracemalloc.stop()
+    return {'peak_request_memory_kb': round(max(peaks) / 1024, 1) if peaks else None, 'max_rss_kb': max_rss_kb()}
+
+def max_rss_kb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    # Kilobytes on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if platform.system() == 'Darwin' else rss
+
+# Worker processes build their own app on the same database
+_worker = {}
+
+def init_worker(settings):
+    app = create_bench_app(**settings)
+    with app.app_context():
+        _worker['counter'] = StatementCounter(db.engine)
+    prepare_redis(app)
+    _worker['app'] = app
+
+def run_slice(name, items, concurrency):
+    counter = _worker['counter']
+    counter.reset()
+    latencies, errors = run_requests(_worker['app'], SCENARIOS[name][1], items, concurrency)
+    return latencies, errors, counter.count
+
+def run_scenario_in_processes(pool, processes, name, items, concurrency):
+    """ Split a scenario's plan across worker processes, each with concurrency/processes threads """
+    threads = max(1, concurrency // processes)
+    slices = [items[index::processes] for index in range(processes)]
+    start = time.perf_counter()
+    results = list(pool.map(run_slice, [name] * processes, slices, [threads] * processes))
+    wall = time.perf_counter() - start
+    latencies = [latency for result in results for latency in result[0]]
+    return summarize(latencies, sum(result[1] for result in results), sum(result[2] for result in results), wall)
+
+def process_pool(processes, settings):
+    return ProcessPoolExecutor(
+        max_workers=processes,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=init_worker,
+        initargs=(settings,)
+    )
+
+def summarize(latencies, errors, statements, wall):
+    ordered = sorted(latencies)
+    requests = len(ordered)
+    return {
+        'requests': requests,
+        'errors': errors,
+        'seconds': round(wall, 3),
+        'throughput_rps': round(requests / wall, 1) if wall else None,
+        'latency_ms': {
+            'mean': round(sum(ordered) / requests * 1000, 2) if requests else None,
+            'p50': percentile(ordered, 50),
+            'p95': percentile(ordered, 95),
+            'p99': percentile(ordered, 99),
+            'max': round(ordered[-1] * 1000, 2) if requests else None,
+        },
+        'statements': statements,
+        'statements_per_request': round(statements / requests, 2) if requests else None,
+    }
+
+def percentile(ordered, pct):
+    """Nearest-rank percentile of sorted latencies, in milliseconds"""
+    if not ordered:
+        return None
+    index = max(0, math.ceil(pct / 100 * len(ordered)) - 1)
+    return round(ordered[index] * 1000, 2)
+
+def environment():
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'started_at': datetime.utcnow().isoformat(),
+        'git_commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+    }
+
+def save_results(results, path):
+    with open(path, 'w') as results_file:
+        json.dump(results, results_file, indent=2, sort_keys=True)
+
+def compare_results(previous, current):
+    """ Lines describing the throughput and p95 change of every scenario in both runs """
+    lines = []
+    for name, result in current['scenarios'].items():
+        before = previous.get('scenarios', {}).get(name)
+        if not before:
+            continue
+        lines.append(
+            f"{name:<18} throughput {change(before['throughput_rps'], result['throughput_rps'])}"
+            f"  p95 {change(before['latency_ms']['p95'], result['latency_ms']['p95'])}"
+            f"  statements/request {before['statements_per_request']} -> {result['statements_per_request']}"
+            + (f"  peak KB/request {change(before.get('peak_request_memory_kb'), result['peak_request_memory_kb'])}"
+               if 'peak_request_memory_kb' in result else '')
+        )
+    return lines
+
+def change(before, after):
+    if not before or after is None:
+        return f"{before} -> {after}"
+    return f"{before} -> {after} ({(after - before) / before * 100:+.1f}%)"
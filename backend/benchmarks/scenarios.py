@@ -0,0 +1,96 @@
+import random
+from datetime import datetime
+from flask_jwt_extended import create_access_token
+from models import *
+from benchmarks.datagen import BENCHMARK_PASSWORD
+
+# A scenario is a pair of functions: plan(iterations, rng) runs in the parent process
+# and returns one picklable item per request, and execute(client, item) makes the
+# request and returns its status code. Keeping the per-request inputs in the plan lets
+# worker processes replay exactly the same requests.
+
+def user_rows():
+    return db.session.query(User.id, User.username, User.role).filter(User.role == 'user').order_by(User.id).all()
+
+def access_token(user_id, username, role):
+    return create_access_token(identity={'id': user_id, 'username': username, 'role': role})
+
+def auth_header(token):
+    return {'Authorization': f'Bearer {token}'}
+
+def user_tokens(iterations, rng):
+    users = user_rows()
+    return [access_token(*rng.choice(users)) for _ in range(iterations)]
+
+def admin_tokens(iterations, rng):
+    admin = db.session.query(User.id, User.username, User.role).filter(User.role == 'admin').first()
+    return [access_token(*admin)] * iterations
+
+def open_quiz_ids(now):
+    return [quiz_id for quiz_id, in db.session.query(Quiz.id).filter(
+        Quiz.status == 'active',
+        Quiz.start_date <= now,
+        Quiz.end_date >= now
+    ).order_by(Quiz.id)]
+
+def plan_login(iterations, rng):
+    users = user_rows()
+    return [rng.choice(users)[1] for _ in range(iterations)]
+
+def execute_login(client, username):
+    return client.post('/login', json={'username': username, 'password': BENCHMARK_PASSWORD}).status_code
+
+def plan_quiz_questions(iterations, rng):
+    # Everyone opens the same quiz at once, as when a scheduled quiz starts
+    quiz_id = open_quiz_ids(datetime.utcnow())[0]
+    return [(token, quiz_id) for token in user_tokens(iterations, rng)]
+
+def execute_quiz_questions(client, item):
+    token, quiz_id = item
+    return client.get(f'/quizzes/{quiz_id}/questions', headers=auth_header(token)).status_code
+
+def plan_attempt(iterations, rng):
+    """One submission per (user, open quiz) pair that has no score yet"""
+    quiz_ids = open_quiz_ids(datetime.utcnow())
+    users = user_rows()
+    attempted = set(db.session.query(Score.quiz_id, Score.user_id).filter(Score.quiz_id.in_(quiz_ids)).all())
+    questions = {}
+    for quiz_id, question_id in db.session.query(Question.quiz_id, Question.id).filter(Question.quiz_id.in_(quiz_ids)):
+        questions.setdefault(quiz_id, []).append(question_id)
+
+    free = [(quiz_id, user) for quiz_id in quiz_ids for user in users if (quiz_id, user[0]) not in attempted]
+    if len(free) < iterations:
+        raise ValueError(f"Only {len(free)} unattempted (user, quiz) pairs for {iterations} attempts")
+    plan = []
+    for quiz_id, user in rng.sample(free, iterations):
+        answers = {str(question_id): rng.randint(1, 4) for question_id in questions.get(quiz_id, [])}
+        plan.append((access_token(*user), quiz_id, answers))
+    return plan
+
+def execute_attempt(client, item):
+    token, quiz_id, answers = item
+    return client.post(f'/quizzes/{quiz_id}/attempt', json={'answers': answers}, headers=auth_header(token)).status_code
+
+def get_scenario(path):
+    """A scenario that GETs `path` as a random user"""
+    def execute(client, token):
+        return client.get(path, headers=auth_header(token)).status_code
+    return execute
+
+# Read scenarios come first: attempts invalidate the caches the others read
+SCENARIOS = {
+    'login': (plan_login, execute_login),
+    'available_quizzes': (user_tokens, get_scenario('/available-quizzes')),
+    'quiz_questions': (plan_quiz_questions, execute_quiz_questions),
+    'my_scores': (user_tokens, get_scenario('/my-scores')),
+    'user_statistics': (user_tokens, get_scenario('/user/statistics')),
+    'admin_statistics': (admin_tokens, get_scenario('/admin/statistics')),
+    'dashboard': (admin_tokens, get_scenario('/admin/dashboard-stats')),
+    'attempt': (plan_attempt, execute_attempt),
+}
+
+# Read-only scenarios, whose requests can be replayed to measure their memory
+MEMORY_SCENARIOS = {'available_quizzes', 'quiz_questions', 'my_scores', 'user_statistics', 'admin_statistics', 'dashboard'}
+
+def new_rng(seed, name):
+    return random.Random(f'{seed}:{name}')
@@ -0,0 +1,279 @@
+import csv
+import io
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from flask import current_app
+import task
+from workers import ContextTask
+from models import *
+from benchmarks import datagen, runner
+from benchmarks.scenarios import new_rng, plan_attempt, admin_tokens, user_tokens, auth_header
+from caching import cache
+from mailer import render_batch
+from question_io import QUESTION_FIELDS
+from submissions import queued_submissions, drain_submissions
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STARTUP_RUNS = 3
+# What gunicorn and a Celery worker load before they can serve anything
+STARTUP_COMMANDS = {
+    'web': "import app",
+    'worker': "import sys; from celery.__main__ import main; sys.argv = ['celery', '-A', 'app.celery', 'report']; main()",
+}
+# ru_maxrss survives fork and exec, so a child of the (large) benchmark process would
+# report our peak; the child's VmHWM is its own, so it reports that on exit instead
+RSS_PROBE = '''import atexit, sys
+def report_rss():
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    sys.stderr.write(f"max rss kb: {line.split()[1]}\\n")
+    except OSError:
+        pass
+atexit.register(report_rss)
+'''
+SLOWEST_IMPORTS = 5
+QUESTION_COUNT = 1000
+QUESTION_LISTINGS = 20
+
+# One-off measurements of the Celery task bodies, run in the app context of the
+# benchmark process. Email delivery is replaced by a stub so only our own work is timed.
+# 'startup' measures fresh web and worker processes instead, and 'submission_concurrency'
+# fresh databases.
+
+def stub_send_bulk(messages):
+    return [(message.recipients, None) for message in messages]
+
+def daily_reminders(counter, args):
+    """ Run the daily reminder shard over every user, as one worker would """
+    user_ids = [user_id for user_id, in db.session.query(User.id).filter(User.role == 'user')]
+    send_bulk = task.send_bulk
+    task.send_bulk = stub_send_bulk
+    try:
+        counter.reset()
+        start = time.perf_counter()
+        report = task.send_daily_reminders_shard.run(user_ids, datetime.utcnow().isoformat())
+        elapsed = time.perf_counter() - start
+    finally:
+        task.send_bulk = send_bulk
+    return {
+        'users': len(user_ids),
+        'sent': report['sent'],
+        'seconds': round(elapsed, 3),
+        'emails_per_second': round(report['sent'] / elapsed, 1) if elapsed else None,
+        'statements': counter.count,
+        'statements_per_1000_users': round(counter.count * 1000 / len(user_ids), 2) if user_ids else None,
+    }
+
+def render_emails(counter, args):
+    """ Render the daily reminder template for --emails users with the batch renderer.
+
+    Contexts are built and rendered a reminder chunk at a time, as the reminder task
+    does, so memory stays flat however many emails are rendered.
+    """
+    users = User.query.filter(User.role == 'user').limit(100).all()
+    chunk_size = task.REMINDER_CHUNK_SIZE
+    rendered = 0
+    start = time.perf_counter()
+    for offset in range(0, args.emails, chunk_size):
+        contexts = [dict(
+            user=users[index % len(users)],
+            recent_scores=index % 5,
+            average_score=index % 100,
+            performance_level='Good',
+            performance_color='#0dcaf0',
+            available_quizzes=index % 7
+        ) for index in range(offset, min(offset + chunk_size, args.emails))]
+        rendered += len(render_batch('daily_reminder.html', contexts))
+    elapsed = time.perf_counter() - start
+    return {'emails': rendered, 'seconds': round(elapsed, 3), 'emails_per_second': round(rendered / elapsed, 1)}
+
+def drain_queued_submissions(counter, args):
+    """ Write out what the attempt scenario queued when SUBMISSION_MODE is 'queued' """
+    if not queued_submissions():
+        return {'skipped': "SUBMISSION_MODE is not 'queued'"}
+    counter.reset()
+    start = time.perf_counter()
+    recorded = drain_submissions()
+    elapsed = time.perf_counter() - start
+    return {
+        'recorded': recorded,
+        'seconds': round(elapsed, 3),
+        'scores_per_second': round(recorded / elapsed, 1) if elapsed else None,
+        'statements': counter.count,
+    }
+
+def questions(counter, args):
+    """ Import QUESTION_COUNT questions into a new draft quiz as CSV, then list them.
+
+    The listing is fetched QUESTION_LISTINGS times as the admin (answers shown) and as
+    a student, clearing the response cache first so each one serializes every row.
+    The quiz is deleted afterwards.
+    """
+    now = datetime.utcnow()
+    quiz = Quiz(chapter_id=db.session.query(Chapter.id).order_by(Chapter.id).first()[0],
+                title='Benchmark questions', start_date=now, end_date=now + timedelta(days=1),
+                time_duration=10, status='draft')
+    db.session.add(quiz)
+    db.session.commit()
+    tokens = {
+        'admin': admin_tokens(1, None)[0],
+        'student': user_tokens(1, random.Random(args.seed))[0],
+    }
+    body = io.StringIO()
+    writer = csv.writer(body)
+    writer.writerow(QUESTION_FIELDS)
+    writer.writerows([f'Question {index}?', 'a', 'b', 'c', 'd', index % 4 + 1] for index in range(QUESTION_COUNT))
+
+    client = current_app.test_client()
+    try:
+        counter.reset()
+        start = time.perf_counter()
+        response = client.post(f'/quizzes/{quiz.id}/questions/import', data=body.getvalue(),
+                               headers={**auth_header(tokens['admin']), 'Content-Type': 'text/csv'})
+        import_seconds = time.perf_counter() - start
+        if response.status_code != 201:
+            raise RuntimeError(f"Question import failed with {response.status_code}: {response.get_data(as_text=True)[:200]}")
+        report = {
+            'questions': QUESTION_COUNT,
+            'import_seconds': round(import_seconds, 3),
+            'imported_per_second': round(QUESTION_COUNT / import_seconds, 1),
+            'import_statements': counter.count,
+            'list_ms': {},
+        }
+        for role, token in tokens.items():
+            timings = []
+            for _ in range(QUESTION_LISTINGS):
+                cache.clear()
+                start = time.perf_counter()
+                client.get(f'/quizzes/{quiz.id}/questions', headers=auth_header(token))
+                timings.append(time.perf_counter() - start)
+            report['list_ms'][role] = round(sorted(timings)[len(timings) // 2] * 1000, 2)
+        return report
+    finally:
+        Question.query.filter_by(quiz_id=quiz.id).delete()
+        db.session.delete(quiz)
+        db.session.commit()
+
+def submission_concurrency(counter, args):
+    """ Run the attempt scenario against a fresh copy of the dataset per database setup.
+
+    SQLite is run with the rollback journal and with WAL, each in a scratch file, and
+    --server-database-url (an empty database) with its connection pool sized to the
+    concurrency. Every setup gets the same dataset, plan and --concurrency.
+    """
+    scratch = tempfile.mkdtemp(prefix='quizme-bench-')
+    setups = {
+        'sqlite_rollback_journal': (f"sqlite:///{os.path.join(scratch, 'journal.db')}", False),
+        'sqlite_wal': (f"sqlite:///{os.path.join(scratch, 'wal.db')}", True),
+    }
+    if args.server_database_url:
+        setups['server_pooled'] = (args.server_database_url, True)
+    flask_app = ContextTask.flask_app
+    report = {}
+    try:
+        for name, (database_url, wal) in setups.items():
+            app = runner.create_bench_app(
+                database_url, cache_type=args.cache_type, bcrypt_rounds=args.bcrypt_rounds,
+                sqlite_wal=wal, pool_size=args.concurrency
+            )
+            with app.app_context():
+                db.create_all()
+                datagen.generate({
+                    'users': args.users,
+                    'subjects': args.subjects,
+                    'chapters_per_subject': args.chapters_per_subject,
+                    'quizzes_per_chapter': args.quizzes_per_chapter,
+                    'questions_per_quiz': args.questions_per_quiz,
+                    'scores': args.scores,
+                }, seed=args.seed, password_rounds=args.bcrypt_rounds)
+                setup_counter = runner.StatementCounter(db.engine)
+            runner.prepare_redis(app)
+            with app.app_context():
+                items = plan_attempt(args.requests, new_rng(args.seed, 'attempt'))
+                result = runner.run_scenario(app, setup_counter, 'attempt', items, args.concurrency)
+                db.engine.dispose()
+            report[name] = {
+                'throughput_rps': result['throughput_rps'],
+                'p95_ms': result['latency_ms']['p95'],
+                'errors': result['errors'],
+            }
+    finally:
+        ContextTask.flask_app = flask_app
+        shutil.rmtree(scratch, ignore_errors=True)
+    return report
+
+def startup(counter, args):
+    """ Start the web and worker entry points in fresh interpreters under -X importtime.
+
+    Times, import totals and max RSS are the best of STARTUP_RUNS runs; the slowest
+    imports are those of the last run.
+    """
+    report = {}
+    for name, code in STARTUP_COMMANDS.items():
+        runs = [start_process(code) for _ in range(STARTUP_RUNS)]
+        report[name] = {
+            'seconds': min(run['seconds'] for run in runs),
+            'import_seconds': min(run['import_seconds'] for run in runs),
+            'max_rss_kb': min((run['max_rss_kb'] for run in runs if run['max_rss_kb']), default=None),
+            'slowest_imports': runs[-1]['slowest_imports'],
+        }
+    return report
+
+def start_process(code):
+    """ Run `python -X importtime -c <code>` from the backend directory and measure it """
+    with tempfile.TemporaryFile() as log:
+        start = time.perf_counter()
+        process = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', RSS_PROBE + code],
+            cwd=BACKEND_DIR, stdout=subprocess.DEVNULL, stderr=log
+        )
+        elapsed = time.perf_counter() - start
+        log.seek(0)
+        output = log.read().decode('utf-8', 'replace')
+    if process.returncode:
+        raise RuntimeError(f"{code!r} exited with {process.returncode}: {output.splitlines()[-1:]}")
+    import_seconds, slowest = parse_importtime(output)
+    rss = [int(line.split(':')[1]) for line in output.splitlines() if line.startswith('max rss kb:')]
+    return {
+        'seconds': round(elapsed, 3),
+        'import_seconds': import_seconds,
+        'max_rss_kb': rss[-1] if rss else None,
+        'slowest_imports': slowest,
+    }
+
+def parse_importtime(output):
+    """ Total import time in seconds and the slowest imports in ms, from -X importtime output """
+    total = 0
+    top_level = []
+    for line in output.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue
+        own, cumulative, module = int(fields[0]), int(fields[1]), fields[2]
+        total += own
+        # Nested imports are indented two spaces per level under the module that
+        # imported them; report the entry module's own imports rather than the module
+        level = (len(module) - len(module.lstrip()) - 1) // 2
+        if level <= 1 and module.strip() != 'app':
+            top_level.append((cumulative, module.strip()))
+    slowest = [[module, round(cumulative / 1000, 1)] for cumulative, module in sorted(top_level, reverse=True)[:SLOWEST_IMPORTS]]
+    return round(total / 1e6, 3), slowest
+
+TASKS = {
+    'daily_reminders': daily_reminders,
+    'render_emails': render_emails,
+    'drain_submissions': drain_queued_submissions,
+    'questions': questions,
+    'submission_concurrency': submission_concurrency,
+    'startup': startup,
+}
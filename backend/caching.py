@@ -0,0 +1,118 @@
+import hashlib
+import json
+import time
+from functools import wraps
+from uuid import uuid4
+from flask import request, make_response
+from flask_caching import Cache
+from auth import current_identity
+
+cache = Cache()
+
+# How long concurrent misses wait for the worker rendering a response before rendering it
+# themselves; they stop waiting as soon as that worker releases the lock without caching
+SINGLE_FLIGHT_WAIT = 5.0
+SINGLE_FLIGHT_POLL = 0.02
+SINGLE_FLIGHT_LOCK_TIMEOUT = 30
+
+# Cached entries are keyed by the current version token of every namespace they
+# depend on. Write routes call bump_version() for the namespaces they change, which
+# moves readers to new keys; the old entries are simply left to expire.
+
+def version_key(namespace):
+    return f'version:{namespace}'
+
+def bump_version(*namespaces):
+    """ Invalidate everything cached under the given namespaces """
+    for namespace in namespaces:
+        cache.set(version_key(namespace), uuid4().hex, timeout=0)
+
+def current_versions(namespaces):
+    keys = [version_key(namespace) for namespace in namespaces]
+    versions = cache.get_many(*keys)
+    for index, version in enumerate(versions):
+        if version is None:
+            # Never seen (or evicted): start a fresh token so no older entry can match
+            cache.add(keys[index], uuid4().hex, timeout=0)
+            # A backend that stores nothing (NullCache) gets a throwaway token
+            versions[index] = cache.get(keys[index]) or uuid4().hex
+    return versions
+
+def versioned_key(key, namespaces):
+    return f"{key}@{'.'.join(current_versions(namespaces))}"
+
+def version_etag(namespaces, *extra):
+    """An ETag that changes whenever one of `namespaces` is bumped or `extra` changes"""
+    return hashlib.sha1(json.dumps([current_versions(namespaces), extra]).encode('utf-8')).hexdigest()
+
+def cached_response(*namespaces, per_user=False, timeout=None):
+    """ Cache the successful responses of a GET view until one of `namespaces` is bumped.
+
+    Namespaces may use '{user_id}' and the view's URL arguments, e.g. 'questions:{quiz_id}'.
+    Keys always include the caller's role, and their id when per_user is set. Streaming
+    requests are never cached.
+
+    Responses are stored as bytes with an ETag of their content, so a client revalidating
+    an unchanged response gets a 304. On a miss only one worker renders the response while
+    concurrent requests for the same key wait for it (see SINGLE_FLIGHT_WAIT).
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method != 'GET' or request.args.get('stream'):
+                return view(*args, **kwargs)
+
+            identity = current_identity()
+            names = [namespace.format(user_id=identity['id'], **kwargs) for namespace in namespaces]
+            key = f"view:{request.path}?{sorted(request.args.items(multi=True))}:{identity['role']}"
+            if per_user:
+                key += f":{identity['id']}"
+            key = versioned_key(key, names)
+
+            cached = cache.get(key)
+            if cached is None:
+                cached = render_once(key, lambda: make_response(view(*args, **kwargs)), timeout)
+                if not isinstance(cached, tuple):
+                    return cached
+            body, status, headers = cached
+            etag = headers.get('ETag', '').strip('"')
+            if etag and etag in request.if_none_match:
+                return make_response('', 304, {'ETag': headers['ETag'], 'Cache-Control': headers['Cache-Control']})
+            return make_response(body, status, headers)
+        return wrapper
+    return decorator
+
+def render_once(key, render, timeout):
+    """ Render and cache a response, letting a single worker do it for concurrent misses.
+
+    Returns the cached (body, status, headers), or the rendered response itself when it
+    is not cacheable.
+    """
+    lock_key = f'lock:{key}'
+    locked = cache.add(lock_key, 1, timeout=SINGLE_FLIGHT_LOCK_TIMEOUT)
+    if not locked:
+        # Someone else is rendering this response; wait for it instead of duplicating the work
+        deadline = time.monotonic() + SINGLE_FLIGHT_WAIT
+        while time.monotonic() < deadline:
+            time.sleep(SINGLE_FLIGHT_POLL)
+            cached, lock = cache.get_many(key, lock_key)
+            if cached is not None:
+                return cached
+            if lock is None:
+                # The renderer is done but cached nothing (an error response, or it raised)
+                break
+    try:
+        response = render()
+        if response.status_code != 200:
+            return response
+        body = response.get_data()
+        headers = {name: value for name, value in response.headers.items()
+                   if name in ('Content-Type', 'X-Next-Cursor')}
+        headers['ETag'] = f'"{hashlib.sha1(body).hexdigest()}"'
+        headers['Cache-Control'] = 'private, no-cache'
+        cached = (body, response.status_code, headers)
+        cache.set(key, cached, timeout=timeout)
+        return cached
+    finally:
+        if locked:
+            cache.delete(lock_key)
@@ -0,0 +1,101 @@
+import hashlib
+import json
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from flask import request, jsonify, make_response, current_app as app
+from caching import cache
+
+CHART_FORMATS = {'png': 'image/png', 'svg': 'image/svg+xml'}
+CHART_WORKERS = 2
+CHART_RENDER_TIMEOUT = 30
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def chart_response(kind, data, chart_format):
+    """ Serve the chart of `data`, rendering it only when no cached copy exists.
+
+    The ETag is a hash of the chart data, so an unchanged chart costs the client a 304
+    and the server a cache lookup; a new render happens only when the data changes.
+    """
+    etag = hashlib.sha1(
+        json.dumps([kind, data, chart_format], sort_keys=True).encode('utf-8')
+    ).hexdigest()
+    if etag in request.if_none_match:
+        response = make_response('', 304)
+    else:
+        key = f'chart:{etag}'
+        image = cache.get(key)
+        if image is None:
+            executor = get_executor()
+            try:
+                future = executor.submit(render_chart, kind, data, chart_format)
+                image = future.result(timeout=app.config.get('CHART_RENDER_TIMEOUT', CHART_RENDER_TIMEOUT))
+            except TimeoutError:
+                future.cancel()
+                app.logger.warning("Rendering the %s chart timed out", kind)
+                return jsonify({"error": "The chart is taking too long to render, try again later"}), 503
+            except BrokenProcessPool:
+                # A chart worker died (OOM kill, segfault); the next request gets a new pool
+                app.logger.warning("Chart pool broke, starting a new one")
+                discard_executor(executor)
+                return jsonify({"error": "The chart could not be rendered, try again later"}), 503
+            cache.set(key, image)
+        response = make_response(image)
+        response.mimetype = CHART_FORMATS[chart_format]
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+def get_executor():
+    """Process pool the charts are rendered in, created on first use in each web process"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=app.config.get('CHART_WORKERS', CHART_WORKERS),
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return _executor
+
+def discard_executor(executor):
+    """Drop a broken pool so the next get_executor() starts a new one"""
+    global _executor
+    with _executor_lock:
+        if _executor is executor:
+            _executor = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+def render_chart(kind, data, chart_format):
+    """ Render a statistics chart to PNG or SVG bytes; runs in a chart worker process """
+    # matplotlib is only ever imported by the chart workers
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    from io import BytesIO
+
+    subjects = data['subjects_performance']
+    trend = data.get('performance_trend')
+    fig, axes = plt.subplots(1, 2 if trend is not None else 1, figsize=(12 if trend is not None else 8, 4), squeeze=False)
+
+    ax = axes[0][0]
+    ax.bar([s['name'] for s in subjects], [s['average_score'] for s in subjects], color='#0d6efd')
+    ax.set_title('Average score by subject')
+    ax.set_ylabel('Average score (%)')
+    ax.set_ylim(0, 100)
+    ax.tick_params(axis='x', labelrotation=30)
+
+    if trend is not None:
+        ax = axes[0][1]
+        ax.plot([t['quiz_title'] for t in trend], [t['score'] for t in trend], marker='o', color='#198754')
+        ax.set_title('Recent performance')
+        ax.set_ylabel('Score (%)')
+        ax.set_ylim(0, 100)
+        ax.tick_params(axis='x', labelrotation=30)
+
+    buffer = BytesIO()
+    fig.savefig(buffer, format=chart_format, bbox_inches='tight')
+    plt.close(fig)
+    return buffer.getvalue()
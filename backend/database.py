@@ -0,0 +1,47 @@
+from functools import partial
+from sqlalchemy import event
+from models import db
+
+SQLITE_BUSY_TIMEOUT_MS = 5000
+
+def database_uri(uri):
+    # Hosting platforms still hand out postgres:// URLs, which SQLAlchemy no longer accepts
+    if uri.startswith('postgres://'):
+        return 'postgresql://' + uri[len('postgres://'):]
+    return uri
+
+def engine_options(config):
+    """ SQLALCHEMY_ENGINE_OPTIONS for the configured database.
+
+    Server databases get a sized connection pool that is pinged before use and
+    recycled periodically; SQLite keeps SQLAlchemy's defaults.
+    """
+    if config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite'):
+        return {}
+    return {
+        'pool_size': config['DATABASE_POOL_SIZE'],
+        'max_overflow': config['DATABASE_MAX_OVERFLOW'],
+        'pool_pre_ping': config['DATABASE_POOL_PRE_PING'],
+        'pool_recycle': config['DATABASE_POOL_RECYCLE'],
+    }
+
+def init_app(app):
+    """ Tune SQLite connections: WAL journaling lets readers proceed during a write and
+    busy_timeout makes writers wait for the lock instead of failing with 'database is locked' """
+    with app.app_context():
+        engine = db.engine
+    if engine.dialect.name == 'sqlite':
+        event.listen(engine, 'connect', partial(
+            configure_sqlite,
+            wal=app.config.get('SQLITE_WAL', True),
+            busy_timeout=app.config.get('SQLITE_BUSY_TIMEOUT_MS', SQLITE_BUSY_TIMEOUT_MS)
+        ))
+
+def configure_sqlite(dbapi_connection, connection_record, wal, busy_timeout):
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f'PRAGMA busy_timeout = {int(busy_timeout)}')
+    if wal:
+        cursor.execute('PRAGMA journal_mode = WAL')
+        # Safe with WAL: a power loss can only drop the last commits, never corrupt the file
+        cursor.execute('PRAGMA synchronous = NORMAL')
+    cursor.close()
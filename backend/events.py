@@ -0,0 +1,196 @@
+import json
+import queue
+import threading
+import time
+from datetime import datetime
+from flask import current_app as app
+from models import *
+from redis_store import get_redis
+from lifecycle import open_quizzes
+
+ACTIVITY_CHANNEL = 'activity'
+# Open quiz count at the last publish_active_quiz_changes() call
+ACTIVE_QUIZZES_KEY = 'dashboard:active_quizzes'
+CLIENT_QUEUE_SIZE = 50
+HEARTBEAT_SECONDS = 15
+RECONNECT_SECONDS = 5
+
+# Write routes publish dashboard events to a Redis pub/sub channel, so every web
+# process sees them. Each process runs one subscriber thread that copies the events
+# into a small bounded queue per connected /admin/activity/stream client; a client
+# too slow to keep up is told to resync instead of growing its queue. gunicorn.conf.py
+# runs the web processes on gevent workers, where the thread and queues are green, so
+# idle streams cost a greenlet each rather than a worker. Events are only built when
+# some process has a stream open.
+
+def publish_event(event_type, **data):
+    """ Publish a dashboard event; failures are logged, never raised to the write route """
+    try:
+        get_redis().publish(ACTIVITY_CHANNEL, json.dumps({'type': event_type, **data}))
+    except Exception as e:
+        app.logger.warning("Could not publish %s event: %s", event_type, e)
+
+def has_subscribers():
+    """Whether any web process has an /admin/activity/stream client listening"""
+    try:
+        return get_redis().pubsub_numsub(ACTIVITY_CHANNEL)[0][1] > 0
+    except Exception as e:
+        app.logger.warning("Could not count activity subscribers: %s", e)
+        return False
+
+def serialize_activity(score, full_name, quiz_title):
+    return {
+        'id': score.id,
+        'icon': 'fas fa-check-circle text-success',
+        'text': f"{full_name} completed quiz '{quiz_title}' with score {score.total_scored}/{score.total_questions}",
+        'timestamp': score.time_stamp_of_attempt.isoformat()
+    }
+
+def publish_attempts(scores):
+    """ Publish an activity event for each newly committed score """
+    if not scores or not has_subscribers():
+        return
+    names = dict(db.session.query(User.id, User.full_name).filter(
+        User.id.in_({score.user_id for score in scores})
+    ).all())
+    titles = dict(db.session.query(Quiz.id, Quiz.title).filter(
+        Quiz.id.in_({score.quiz_id for score in scores})
+    ).all())
+    for score in scores:
+        publish_event('attempt', activity=serialize_activity(score, names[score.user_id], titles[score.quiz_id]))
+
+def active_quiz_count():
+    now = datetime.utcnow()
+    open_quiz_counts = open_quizzes(now)
+    if open_quiz_counts is not None:
+        return len(open_quiz_counts)
+    return Quiz.query.filter(
+        Quiz.status == 'active',
+        Quiz.start_date <= now,
+        Quiz.end_date >= now
+    ).count()
+
+def dashboard_summary(active_quizzes=None):
+    """The dashboard's counters and latest subject and chapter"""
+    # Get latest subject
+    latest_subject = Subject.query.order_by(Subject.id.desc()).first()
+    latest_subject_data = None
+    if latest_subject:
+        latest_subject_data = {
+            'id': latest_subject.id,
+            'name': latest_subject.name
+        }
+    
+    # Get latest chapter
+    latest_chapter = Chapter.query.order_by(Chapter.id.desc()).first()
+    latest_chapter_data = None
+    if latest_chapter:
+        latest_chapter_data = {
+            'id': latest_chapter.id,
+            'name': latest_chapter.name
+        }
+    
+    return {
+        'stats': {
+            'subjects': Subject.query.count(),
+            'chapters': Chapter.query.count(),
+            'activeQuizzes': active_quiz_count() if active_quizzes is None else active_quizzes,
+            # Users excluding admin
+            'users': User.query.filter(User.role != 'admin').count()
+        },
+        'latestSubject': latest_subject_data,
+        'latestChapter': latest_chapter_data
+    }
+
+def publish_counts(active_quizzes=None):
+    """Push fresh dashboard counters to the admin activity streams after a write"""
+    # The counters take six queries, so skip them when no dashboard is open
+    if has_subscribers():
+        publish_event('summary', **dashboard_summary(active_quizzes))
+
+def publish_active_quiz_changes():
+    """ Push the counters when the number of open quizzes moved since the last call.
+
+    Quizzes open and close with the clock, not only with writes, so the lifecycle task
+    calls this every run. Returns whether anything was published.
+    """
+    active_quizzes = active_quiz_count()
+    try:
+        previous = get_redis().set(ACTIVE_QUIZZES_KEY, active_quizzes, get=True)
+    except Exception as e:
+        app.logger.warning("Could not compare the active quiz count: %s", e)
+        previous = None
+    if previous is not None and int(previous) == active_quizzes:
+        return False
+    publish_counts(active_quizzes)
+    return True
+
+class ActivityBroadcaster:
+    """Fans the activity channel out to the streams connected to this process"""
+
+    def __init__(self):
+        self.clients = set()
+        self.lock = threading.Lock()
+        self.listener = None
+
+    def subscribe(self):
+        client = queue.Queue(maxsize=app.config.get('ACTIVITY_CLIENT_QUEUE_SIZE', CLIENT_QUEUE_SIZE))
+        with self.lock:
+            self.clients.add(client)
+            if self.listener is None or not self.listener.is_alive():
+                self.listener = threading.Thread(
+                    target=self.listen, args=(app._get_current_object(),), daemon=True
+                )
+                self.listener.start()
+        return client
+
+    def unsubscribe(self, client):
+        with self.lock:
+            self.clients.discard(client)
+
+    def listen(self, flask_app):
+        with flask_app.app_context():
+            while True:
+                try:
+                    pubsub = get_redis().pubsub(ignore_subscribe_messages=True)
+                    pubsub.subscribe(ACTIVITY_CHANNEL)
+                    for message in pubsub.listen():
+                        self.broadcast(message['data'])
+                except Exception as e:
+                    flask_app.logger.warning("Activity subscriber lost Redis, retrying: %s", e)
+                    self.broadcast(json.dumps({'type': 'resync'}))
+                    time.sleep(RECONNECT_SECONDS)
+
+    def broadcast(self, data):
+        with self.lock:
+            clients = list(self.clients)
+        for client in clients:
+            try:
+                client.put_nowait(data)
+            except queue.Full:
+                # Drop the backlog; the dashboard refetches everything on resync
+                with client.mutex:
+                    client.queue.clear()
+                client.put_nowait(json.dumps({'type': 'resync'}))
+
+broadcaster = ActivityBroadcaster()
+
+def stream_activity(heartbeat=None):
+    """ Generate the text/event-stream body of one /admin/activity/stream connection """
+    heartbeat = heartbeat or app.config.get('ACTIVITY_HEARTBEAT_SECONDS', HEARTBEAT_SECONDS)
+    client = broadcaster.subscribe()
+
+    def generate():
+        try:
+            yield f'retry: {RECONNECT_SECONDS * 1000}\n\n'
+            while True:
+                try:
+                    data = client.get(timeout=heartbeat)
+                except queue.Empty:
+                    # Comment line, keeps proxies from closing an idle stream
+                    yield ': heartbeat\n\n'
+                    continue
+                yield f'data: {data}\n\n'
+        finally:
+            broadcaster.unsubscribe(client)
+    return generate()
@@ -0,0 +1,32 @@
+from collections import OrderedDict
+from caching import cache, versioned_key
+from models import db, Question
+
+LOCAL_KEY_LIMIT = 256
+
+# Answer keys already unpickled by this process, by versioned cache key
+_local_keys = OrderedDict()
+
+def get_answer_key(quiz_id):
+    """ Tuple of (question id as str, correct option) for a quiz, built once per question set.
+
+    Shared through the cache and invalidated by bumping 'questions:<quiz_id>' or 'quiz:<quiz_id>'.
+    """
+    key = versioned_key(f'answer-key:{quiz_id}', [f'questions:{quiz_id}', f'quiz:{quiz_id}'])
+    answer_key = _local_keys.get(key)
+    if answer_key is None:
+        answer_key = cache.get(key)
+        if answer_key is None:
+            rows = db.session.query(Question.id, Question.correct_option).filter(
+                Question.quiz_id == quiz_id
+            ).order_by(Question.id).all()
+            answer_key = tuple((str(question_id), correct_option) for question_id, correct_option in rows)
+            cache.set(key, answer_key)
+        _local_keys[key] = answer_key
+        if len(_local_keys) > LOCAL_KEY_LIMIT:
+            _local_keys.popitem(last=False)
+    return answer_key
+
+def grade(answer_key, answers):
+    """Number of answers matching the key; `answers` maps question id strings to options"""
+    return sum(1 for question_id, correct_option in answer_key if answers.get(question_id) == correct_option)
@@ -0,0 +1,14 @@
+# Production web server settings, run from the backend directory with
+#
+#     gunicorn -c gunicorn.conf.py app:app
+#
+# Every open /admin/activity/stream holds its request for as long as the dashboard
+# is open, which on a sync worker pins the whole worker. gevent workers serve each
+# request in a greenlet, so a stream costs a greenlet and a socket instead.
+import os
+
+bind = os.environ.get('WEB_BIND', '0.0.0.0:5000')
+worker_class = 'gevent'
+workers = int(os.environ.get('WEB_WORKERS', 2))
+# Concurrent requests per worker, open streams included
+worker_connections = int(os.environ.get('WEB_WORKER_CONNECTIONS', 1000))
@@ -0,0 +1,100 @@
+from datetime import datetime, timezone
+from flask import current_app as app
+from models import *
+from redis_store import get_redis
+
+QUIZ_INDEX_READY = 'quizzes:indexed'
+QUIZ_STARTS = 'quizzes:starts'
+QUIZ_ENDS = 'quizzes:ends'
+QUESTION_COUNTS = 'quizzes:question_counts'
+
+# Published ('active') quizzes that have not ended are kept in Redis: two sorted sets
+# of quiz ids scored by start and end time, and a hash of their question counts. A
+# quiz is open when its start score is <= now and its end score >= now, so reads are
+# exact at both boundaries without waiting for the lifecycle task. That task moves
+# ended quizzes to 'expired' and rebuilds the index every minute; write routes keep it
+# current in between. Readers fall back to SQL when Redis or the index is missing.
+
+def timestamp(moment):
+    # Quiz dates are naive UTC
+    return moment.replace(tzinfo=timezone.utc).timestamp()
+
+def expire_quizzes(now):
+    """ Move published quizzes whose end date has passed to 'expired'; returns how many """
+    return Quiz.query.filter(
+        Quiz.status == 'active',
+        Quiz.end_date < now
+    ).update({Quiz.status: 'expired'}, synchronize_session=False)
+
+def rebuild_quiz_index(now):
+    """ Replace the Redis index with the published quizzes that have not ended """
+    rows = db.session.query(
+        Quiz.id,
+        Quiz.start_date,
+        Quiz.end_date,
+        db.func.count(Question.id)
+    ).outerjoin(Question, Question.quiz_id == Quiz.id).filter(
+        Quiz.status == 'active',
+        Quiz.end_date >= now
+    ).group_by(Quiz.id).all()
+
+    pipe = get_redis().pipeline()
+    pipe.delete(QUIZ_STARTS, QUIZ_ENDS, QUESTION_COUNTS)
+    if rows:
+        pipe.zadd(QUIZ_STARTS, {quiz_id: timestamp(start) for quiz_id, start, end, count in rows})
+        pipe.zadd(QUIZ_ENDS, {quiz_id: timestamp(end) for quiz_id, start, end, count in rows})
+        pipe.hset(QUESTION_COUNTS, mapping={quiz_id: count for quiz_id, start, end, count in rows})
+    pipe.set(QUIZ_INDEX_READY, now.isoformat())
+    pipe.execute()
+    return len(rows)
+
+def index_quiz(quiz):
+    """ Bring one quiz's index entry up to date after it or its questions changed """
+    quiz_id = getattr(quiz, 'id', None)
+    try:
+        pipe = get_redis().pipeline()
+        if quiz.status == 'active' and quiz.end_date >= datetime.utcnow():
+            pipe.zadd(QUIZ_STARTS, {quiz.id: timestamp(quiz.start_date)})
+            pipe.zadd(QUIZ_ENDS, {quiz.id: timestamp(quiz.end_date)})
+            pipe.hset(QUESTION_COUNTS, quiz.id, Question.query.filter_by(quiz_id=quiz.id).count())
+        else:
+            remove_from_index(pipe, quiz.id)
+        pipe.execute()
+    except Exception as e:
+        # The next lifecycle run rebuilds the index
+        app.logger.warning("Could not update the quiz index for quiz %s: %s", quiz_id, e)
+
+def unindex_quiz(*quiz_ids):
+    """Drop deleted quizzes from the index"""
+    try:
+        pipe = get_redis().pipeline()
+        for quiz_id in quiz_ids:
+            remove_from_index(pipe, quiz_id)
+        pipe.execute()
+    except Exception as e:
+        app.logger.warning("Could not update the quiz index for quizzes %s: %s", quiz_ids, e)
+
+def remove_from_index(pipe, quiz_id):
+    pipe.zrem(QUIZ_STARTS, quiz_id)
+    pipe.zrem(QUIZ_ENDS, quiz_id)
+    pipe.hdel(QUESTION_COUNTS, quiz_id)
+
+def open_quizzes(now=None):
+    """ {quiz id: question count} of the quizzes open for attempts now, from Redis.
+
+    Returns None when the index is unavailable, in which case callers query SQL.
+    """
+    now = timestamp(now or datetime.utcnow())
+    try:
+        pipe = get_redis().pipeline()
+        pipe.exists(QUIZ_INDEX_READY)
+        pipe.zrangebyscore(QUIZ_STARTS, '-inf', now)
+        pipe.zrangebyscore(QUIZ_ENDS, now, '+inf')
+        pipe.hgetall(QUESTION_COUNTS)
+        ready, started, not_ended, counts = pipe.execute()
+    except Exception as e:
+        app.logger.warning("Quiz index unavailable, falling back to SQL: %s", e)
+        return None
+    if not ready:
+        return None
+    return {int(quiz_id): int(counts.get(quiz_id, 0)) for quiz_id in set(started) & set(not_ended)}
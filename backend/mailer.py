@@ -1,10 +1,77 @@
+import smtplib
 from flask_mail import Mail, Message
 from flask import current_app as app
 
 mail = Mail()
 
-def send_email(subject, to, body=None):
-    sender = 'noreply@quizme.com'
+SENDER = 'noreply@quizme.com'
+MAIL_BATCH_SIZE = 100
+
+_templates = {}
+
+def build_message(subject, to, body=None):
+    return Message(subject, recipients=[to], sender=SENDER, html=body)
+
+def get_template(name):
+    """The app's compiled Jinja template, looked up once per worker process"""
+    template = _templates.get(name)
+    if template is None:
+        template = _templates[name] = app.jinja_env.get_template(name)
+    return template
+
+def render_batch(name, contexts):
+    """ Render one email template for each context in `contexts`.
+
+    Unlike render_template this skips the per-call template lookup, context
+    processors and signals, none of which the email templates use.
+    """
+    template = get_template(name)
+    return [template.render(context) for context in contexts]
+
+def send_bulk(messages, batch_size=None):
+    """ Send messages reusing one SMTP connection for every `batch_size` messages.
+
+    A dropped connection is reopened and the message retried once. Returns a list
+    of (recipients, error) tuples in message order, error being None on success.
+    """
+    batch_size = batch_size or app.config.get('MAIL_BATCH_SIZE', MAIL_BATCH_SIZE)
+    outcomes = []
     with app.app_context():
-        msg = Message(subject, recipients=[to], sender=sender, html=body)
-        mail.send(msg)
+        conn = None
+        try:
+            for index, msg in enumerate(messages):
+                if index % batch_size == 0:
+                    conn = _close(conn)
+                error = None
+                try:
+                    if conn is None:
+                        conn = _connect()
+                    conn.send(msg)
+                except (smtplib.SMTPServerDisconnected, ConnectionError, TimeoutError):
+                    # The connection went away underneath us, reopen it and retry once
+                    conn = _close(conn)
+                    try:
+                        conn = _connect()
+                        conn.send(msg)
+                    except (smtplib.SMTPException, OSError) as e:
+                        conn = _close(conn)
+                        error = str(e) or e.__class__.__name__
+                except (smtplib.SMTPException, OSError) as e:
+                    error = str(e) or e.__class__.__name__
+                outcomes.append((msg.recipients, error))
+        finally:
+            _close(conn)
+    return outcomes
+
+def _connect():
+    conn = mail.connect()
+    conn.__enter__()
+    return conn
+
+def _close(conn):
+    if conn is not None:
+        try:
+            conn.__exit__(None, None, None)
+        except (smtplib.SMTPException, OSError):
+            pass
+    return None
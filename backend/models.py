@@ -1,9 +1,8 @@
 from flask_sqlalchemy import SQLAlchemy
-from flask_bcrypt import Bcrypt
 from datetime import datetime
+from passwords import generate_password_hash
 
 db = SQLAlchemy()
-bcrypt = Bcrypt()
 
 class User(db.Model):
     __tablename__ = 'users'
@@ -20,7 +19,7 @@ class User(db.Model):
 
     def __init__(self, username, password, full_name, qualification, dob, role='user'):
         self.username = username
-        self.password = bcrypt.generate_password_hash(password).decode('utf-8')
+        self.password = generate_password_hash(password)
         self.full_name = full_name
         self.qualification = qualification
         self.dob = dob
@@ -43,6 +42,9 @@ class Subject(db.Model):
 
 class Chapter(db.Model):
     __tablename__ = 'chapters'
+    __table_args__ = (
+        db.Index('ix_chapters_subject_id', 'subject_id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     subject_id = db.Column(db.Integer, db.ForeignKey('subjects.id'), nullable=False)
     name = db.Column(db.String(100), nullable=False)
@@ -56,6 +58,10 @@ class Chapter(db.Model):
 
 class Quiz(db.Model):
     __tablename__ = 'quizzes'
+    __table_args__ = (
+        db.Index('ix_quizzes_chapter_id', 'chapter_id'),
+        db.Index('ix_quizzes_status_dates', 'status', 'start_date', 'end_date'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     chapter_id = db.Column(db.Integer, db.ForeignKey('chapters.id'), nullable=False)
     title = db.Column(db.String(200), nullable=False)
@@ -90,6 +96,9 @@ class Quiz(db.Model):
 
 class Question(db.Model):
     __tablename__ = 'questions'
+    __table_args__ = (
+        db.Index('ix_questions_quiz_id', 'quiz_id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     quiz_id = db.Column(db.Integer, db.ForeignKey('quizzes.id'), nullable=False)
     question_statement = db.Column(db.Text, nullable=False)
@@ -104,12 +113,62 @@ class Question(db.Model):
 
 class Score(db.Model):
     __tablename__ = 'scores'
+    __table_args__ = (
+        db.Index('ix_scores_user_id_time', 'user_id', 'time_stamp_of_attempt'),
+        db.Index('uq_scores_quiz_id_user_id', 'quiz_id', 'user_id', unique=True),
+        db.Index('ix_scores_time', 'time_stamp_of_attempt'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     quiz_id = db.Column(db.Integer, db.ForeignKey('quizzes.id'), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     time_stamp_of_attempt = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     total_scored = db.Column(db.Float, nullable=False)
     total_questions = db.Column(db.Integer, nullable=False)
+    idempotency_key = db.Column(db.String(64))  # client supplied, to replay a resent submission
 
     def __repr__(self):
-        return f'Score {self.total_scored}/{self.total_questions} for Quiz {self.quiz_id}'
\ No newline at end of file
+        return f'Score {self.total_scored}/{self.total_questions} for Quiz {self.quiz_id}'
+
+# Score rollups, maintained by rollups.record_attempt when a Score is inserted and
+# rebuilt from the scores table by rollups.rebuild_rollups. They are derived data,
+# so they carry no foreign keys; rollups.remove_quiz_scores takes a deleted quiz's
+# scores out of them.
+class RollupColumns:
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    percentage_sum = db.Column(db.Float, nullable=False, default=0)
+    best_percentage = db.Column(db.Float, nullable=False, default=0)
+    last_attempt_at = db.Column(db.DateTime)
+
+    @property
+    def average_percentage(self):
+        return self.percentage_sum / self.attempts if self.attempts else 0
+
+class UserStats(RollupColumns, db.Model):
+    __tablename__ = 'user_stats'
+    user_id = db.Column(db.Integer, primary_key=True)
+
+class UserSubjectStats(RollupColumns, db.Model):
+    __tablename__ = 'user_subject_stats'
+    user_id = db.Column(db.Integer, primary_key=True)
+    subject_id = db.Column(db.Integer, primary_key=True)
+
+class SubjectStats(RollupColumns, db.Model):
+    __tablename__ = 'subject_stats'
+    subject_id = db.Column(db.Integer, primary_key=True)
+
+class QuizStats(RollupColumns, db.Model):
+    __tablename__ = 'quiz_stats'
+    quiz_id = db.Column(db.Integer, primary_key=True)
+
+# When each user's scheduled emails are next due, see schedules.py. The dispatcher only
+# reads rows whose next_due_at has passed, through ix_email_schedules_due.
+class EmailSchedule(db.Model):
+    __tablename__ = 'email_schedules'
+    __table_args__ = (
+        db.Index('ix_email_schedules_due', 'kind', 'next_due_at'),
+    )
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    kind = db.Column(db.String(32), primary_key=True)  # daily_reminders or monthly_activity_report
+    send_hour = db.Column(db.Integer, nullable=False)  # UTC hour of the user's send window
+    next_due_at = db.Column(db.DateTime, nullable=False)
+    last_sent_at = db.Column(db.DateTime)
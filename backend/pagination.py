@@ -0,0 +1,48 @@
+from flask import request, jsonify, json, Response, stream_with_context
+from sqlalchemy.engine import Row
+
+MAX_PAGE_SIZE = 1000
+STREAM_BATCH_SIZE = 500
+
+def list_response(query, key, serialize):
+    """ Respond with the rows of `query` serialized as a JSON array.
+
+    Without arguments every row is returned, as before. ?limit=N returns one page
+    ordered by `key`; when more rows exist the key of the last row is sent in the
+    X-Next-Cursor header, to be passed back as ?after=<cursor> for the next page.
+    ?stream=1 writes the array out incrementally so large exports run in bounded memory.
+    """
+    after = request.args.get('after', type=int)
+    limit = request.args.get('limit', type=int)
+    if after is not None:
+        query = query.filter(key > after)
+    query = query.order_by(key)
+
+    if request.args.get('stream'):
+        if limit is not None:
+            query = query.limit(limit)
+        return Response(stream_with_context(stream_json(query, serialize)), mimetype='application/json')
+
+    if limit is None:
+        return jsonify([serialize(row) for row in query.all()]), 200
+
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    rows = query.limit(limit + 1).all()
+    response = jsonify([serialize(row) for row in rows[:limit]])
+    if len(rows) > limit:
+        response.headers['X-Next-Cursor'] = str(cursor_of(rows[limit - 1], key))
+    return response, 200
+
+def stream_json(query, serialize):
+    """Yield a JSON array of the serialized rows, fetching STREAM_BATCH_SIZE rows at a time"""
+    yield '['
+    for index, row in enumerate(query.yield_per(STREAM_BATCH_SIZE)):
+        if index:
+            yield ','
+        yield json.dumps(serialize(row))
+    yield ']'
+
+def cursor_of(row, key):
+    """Value of the pagination key column for a result row"""
+    entity = row[0] if isinstance(row, Row) else row
+    return getattr(entity, key.key)
@@ -0,0 +1,69 @@
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import bcrypt
+from flask import current_app as app
+
+BCRYPT_LOG_ROUNDS = 12
+PASSWORD_HASH_WORKERS = 2
+
+_executor = None
+_executor_lock = threading.Lock()
+
+# bcrypt is deliberately CPU-heavy. Hashing and checking run in a small process pool
+# so a login burst queues on PASSWORD_HASH_WORKERS cores instead of occupying every
+# web worker; PASSWORD_HASH_WORKERS = 0 runs them inline. A pool whose worker died
+# (OOM kill, segfault) is broken for good, so it is replaced and the call retried once.
+
+def generate_password_hash(password):
+    """ Hash a password with the configured BCRYPT_LOG_ROUNDS """
+    return run(hash_password, password, log_rounds())
+
+def check_password_hash(password_hash, password):
+    return run(verify_password, password_hash, password)
+
+def needs_rehash(password_hash):
+    """Whether the hash was made with a different cost than the one configured now"""
+    return hash_rounds(password_hash) != log_rounds()
+
+def hash_rounds(password_hash):
+    # bcrypt hashes look like $2b$<rounds>$<salt and digest>
+    return int(password_hash.split('$')[2])
+
+def log_rounds():
+    return app.config.get('BCRYPT_LOG_ROUNDS', BCRYPT_LOG_ROUNDS)
+
+def hash_password(password, rounds):
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds)).decode('utf-8')
+
+def verify_password(password_hash, password):
+    return bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('utf-8'))
+
+def run(function, *args):
+    workers = app.config.get('PASSWORD_HASH_WORKERS', PASSWORD_HASH_WORKERS)
+    if not workers:
+        return function(*args)
+    executor = get_executor(workers)
+    try:
+        return executor.submit(function, *args).result()
+    except BrokenProcessPool:
+        app.logger.warning("Password hashing pool broke, starting a new one")
+        discard_executor(executor)
+        return get_executor(workers).submit(function, *args).result()
+
+def get_executor(workers):
+    """Process pool for password hashing, created on first use in each web process"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+        return _executor
+
+def discard_executor(executor):
+    """Drop a broken pool so the next get_executor() starts a new one"""
+    global _executor
+    with _executor_lock:
+        if _executor is executor:
+            _executor = None
+    executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,113 @@
+import csv
+import io
+import json
+from models import db, Question
+
+QUESTION_FIELDS = ['question_statement', 'option1', 'option2', 'option3', 'option4', 'correct_option']
+IMPORT_FORMATS = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+}
+IMPORT_BATCH_SIZE = 1000
+EXPORT_BATCH_SIZE = 1000
+MAX_REPORTED_ERRORS = 100
+
+def import_format(content_type, requested=None):
+    """Pick the import format from an explicit ?format= or the request's content type"""
+    if requested:
+        return requested if requested in IMPORT_FORMATS else None
+    if content_type in ('text/csv', 'application/csv'):
+        return 'csv'
+    if content_type in ('application/x-ndjson', 'application/jsonl', 'application/json-lines'):
+        return 'jsonl'
+    return None
+
+def iter_records(stream, file_format):
+    """ Yield (line number, record dict) from a CSV or JSON Lines byte stream, one row at a time """
+    # utf-8-sig drops the byte order mark spreadsheet exports start with
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    if file_format == 'csv':
+        reader = csv.DictReader(text)
+        for record in reader:
+            yield reader.line_num, record
+        return
+    for line_number, line in enumerate(text, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            record = None
+        yield line_number, record
+
+def validate_question(record):
+    """Return (mapping, None) for a valid question record or (None, error message)"""
+    if not isinstance(record, dict):
+        return None, "Each line must be a JSON object"
+    missing_fields = [field for field in QUESTION_FIELDS if not record.get(field)]
+    if missing_fields:
+        return None, f"Missing required fields: {', '.join(missing_fields)}"
+    try:
+        correct_option = int(record['correct_option'])
+    except (TypeError, ValueError):
+        return None, "Correct option must be a number between 1 and 4"
+    if not 1 <= correct_option <= 4:
+        return None, "Correct option must be between 1 and 4"
+    mapping = {field: str(record[field]) for field in QUESTION_FIELDS[:-1]}
+    mapping['correct_option'] = correct_option
+    return mapping, None
+
+def import_questions(quiz_id, records):
+    """ Validate and insert question records into a quiz in a single transaction.
+
+    Rows are inserted in IMPORT_BATCH_SIZE executemany batches as they are validated;
+    if any row is invalid nothing is committed. Returns (imported count, errors).
+    """
+    errors = []
+    batch = []
+    imported = 0
+    for line_number, record in records:
+        mapping, error = validate_question(record)
+        if error:
+            if len(errors) < MAX_REPORTED_ERRORS:
+                errors.append(f"Line {line_number}: {error}")
+            continue
+        if errors:
+            # Keep validating to report every problem, but stop inserting
+            continue
+        mapping['quiz_id'] = quiz_id
+        batch.append(mapping)
+        if len(batch) >= IMPORT_BATCH_SIZE:
+            db.session.bulk_insert_mappings(Question, batch)
+            imported += len(batch)
+            batch = []
+
+    if errors:
+        db.session.rollback()
+        return 0, errors
+    if batch:
+        db.session.bulk_insert_mappings(Question, batch)
+        imported += len(batch)
+    db.session.commit()
+    return imported, []
+
+def export_questions(quiz_id, file_format):
+    """ Yield the quiz's questions as CSV or JSON Lines text, EXPORT_BATCH_SIZE rows at a time """
+    rows = db.session.query(
+        *(getattr(Question, field) for field in QUESTION_FIELDS)
+    ).filter(Question.quiz_id == quiz_id).order_by(Question.id).yield_per(EXPORT_BATCH_SIZE)
+
+    if file_format == 'csv':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(QUESTION_FIELDS)
+        for row in rows:
+            writer.writerow(row)
+            if buffer.tell() > 64 * 1024:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+        return
+    for row in rows:
+        yield json.dumps(dict(zip(QUESTION_FIELDS, row))) + '\n'
@@ -0,0 +1,14 @@
+import redis
+from flask import current_app as app
+
+def get_redis():
+    """ Redis client for the app's own data structures (submission queue etc.).
+
+    Uses REDIS_URL, falling back to the Celery broker. The client is created once per
+    app and kept in app.extensions['redis'], where tests can put a fakeredis instance.
+    """
+    client = app.extensions.get('redis')
+    if client is None:
+        url = app.config.get('REDIS_URL') or app.config['CELERY_BROKER_URL']
+        client = app.extensions['redis'] = redis.Redis.from_url(url, decode_responses=True)
+    return client
@@ -0,0 +1,191 @@
+from sqlalchemy import bindparam, tuple_
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from models import *
+
+# Dialects whose insert() supports on_conflict_do_update, see bump()
+UPSERT_INSERTS = {
+    'postgresql': postgresql.insert,
+    'sqlite': sqlite.insert,
+}
+
+# Rollup keys looked up per statement in remove_quiz_scores, well under SQLite's bound parameter limit
+KEY_BATCH_SIZE = 500
+
+ROLLUPS = (
+    (UserStats, (Score.user_id,)),
+    (UserSubjectStats, (Score.user_id, Chapter.subject_id)),
+    (SubjectStats, (Chapter.subject_id,)),
+    (QuizStats, (Score.quiz_id,)),
+)
+
+def score_percentage():
+    """SQL expression for a score's percentage"""
+    return Score.total_scored * 100.0 / db.func.nullif(Score.total_questions, 0)
+
+def record_attempt(score, subject_id):
+    """ Add a newly inserted score to every rollup, in the caller's transaction """
+    if score.total_questions:
+        percentage = score.total_scored / score.total_questions * 100
+    else:
+        percentage = 0
+    keys = {
+        UserStats: {'user_id': score.user_id},
+        UserSubjectStats: {'user_id': score.user_id, 'subject_id': subject_id},
+        SubjectStats: {'subject_id': subject_id},
+        QuizStats: {'quiz_id': score.quiz_id},
+    }
+    for model, key in keys.items():
+        bump(model, key, percentage, score.time_stamp_of_attempt)
+
+def bump(model, key, percentage, attempted_at):
+    """ Add one attempt to a rollup row, creating the row if it is the first.
+
+    A single INSERT ... ON CONFLICT DO UPDATE where the database has one, so two
+    concurrent first attempts cannot both try to insert the same key.
+    """
+    insert = UPSERT_INSERTS.get(db.session.get_bind().dialect.name)
+    if insert is None:
+        return bump_in_savepoint(model, key, percentage, attempted_at)
+    table = model.__table__
+    statement = insert(table).values(
+        attempts=1,
+        percentage_sum=percentage,
+        best_percentage=percentage,
+        last_attempt_at=attempted_at,
+        **key
+    )
+    db.session.execute(statement.on_conflict_do_update(
+        index_elements=list(key),
+        set_=increments(table.c, percentage, attempted_at)
+    ))
+
+def bump_in_savepoint(model, key, percentage, attempted_at):
+    """Update-or-insert for databases without ON CONFLICT, retrying the update if a concurrent insert wins"""
+    columns = model.__table__.c
+    for _ in range(2):
+        updated = db.session.execute(
+            model.__table__.update().filter_by(**key).values(increments(columns, percentage, attempted_at))
+        ).rowcount
+        if updated:
+            return
+        try:
+            with db.session.begin_nested():
+                db.session.execute(model.__table__.insert().values(
+                    attempts=1,
+                    percentage_sum=percentage,
+                    best_percentage=percentage,
+                    last_attempt_at=attempted_at,
+                    **key
+                ))
+            return
+        except IntegrityError:
+            continue
+    raise RuntimeError(f"Could not update {model.__tablename__} for {key}")
+
+def increments(columns, percentage, attempted_at):
+    return {
+        'attempts': columns.attempts + 1,
+        'percentage_sum': columns.percentage_sum + percentage,
+        'best_percentage': db.case(
+            (columns.best_percentage < percentage, percentage),
+            else_=columns.best_percentage
+        ),
+        'last_attempt_at': attempted_at,
+    }
+
+def totals_by(group_columns, *criteria):
+    """SELECT of the rollup columns of the scores matching `criteria`, grouped by `group_columns`"""
+    percentage = db.func.coalesce(score_percentage(), 0)
+    return db.select(
+        *group_columns,
+        db.func.count(Score.id),
+        db.func.sum(percentage),
+        db.func.max(percentage),
+        db.func.max(Score.time_stamp_of_attempt)
+    ).select_from(Score).join(Quiz, Quiz.id == Score.quiz_id).join(
+        Chapter, Chapter.id == Quiz.chapter_id
+    ).filter(*criteria).group_by(*group_columns)
+
+def insert_totals(model, totals):
+    table = model.__table__
+    key_columns = [column.key for column in totals.selected_columns][:-4]
+    db.session.execute(table.insert().from_select(
+        key_columns + ['attempts', 'percentage_sum', 'best_percentage', 'last_attempt_at'],
+        totals
+    ))
+
+def rebuild_rollups():
+    """ Recompute every rollup table from the scores table, in the caller's transaction.
+
+    This reads every score, see the rebuild-rollups command. Deletes go through
+    remove_quiz_scores instead.
+    """
+    for model, group_columns in ROLLUPS:
+        db.session.execute(model.__table__.delete())
+        insert_totals(model, totals_by(group_columns))
+
+def remove_quiz_scores(quiz_ids):
+    """ Take the scores of quizzes about to be deleted out of every rollup, in the caller's transaction.
+
+    Call it before deleting the quizzes. Rows are decremented by the removed totals; only
+    rows whose best_percentage or last_attempt_at may have come from a removed score are
+    recomputed, from the scores that remain, so the work follows the number of removed
+    scores rather than the size of the scores table.
+    """
+    if not quiz_ids:
+        return
+    for model, group_columns in ROLLUPS:
+        table = model.__table__
+        key_columns = [table.c[column.key] for column in group_columns]
+        removed = {
+            tuple(row[:len(key_columns)]): row[len(key_columns):]
+            for row in db.session.execute(totals_by(group_columns, Score.quiz_id.in_(quiz_ids)))
+        }
+        updates, emptied, stale = [], [], []
+        for keys in batched(list(removed)):
+            rows = db.session.execute(
+                db.select(*key_columns, table.c.attempts, table.c.percentage_sum,
+                          table.c.best_percentage, table.c.last_attempt_at).filter(key_in(key_columns, keys))
+            )
+            for *key, attempts, percentage_sum, best_percentage, last_attempt_at in rows:
+                key = tuple(key)
+                removed_attempts, removed_sum, removed_best, removed_last = removed[key]
+                if attempts <= removed_attempts:
+                    emptied.append(key)
+                elif last_attempt_at is None or removed_best >= best_percentage or removed_last >= last_attempt_at:
+                    stale.append(key)
+                else:
+                    updates.append({
+                        **{f'key_{column.key}': value for column, value in zip(key_columns, key)},
+                        'attempts': attempts - removed_attempts,
+                        'percentage_sum': percentage_sum - removed_sum,
+                    })
+        if updates:
+            db.session.execute(
+                table.update().where(*(column == bindparam(f'key_{column.key}') for column in key_columns)),
+                updates
+            )
+        for keys in batched(emptied + stale):
+            db.session.execute(table.delete().where(key_in(key_columns, keys)))
+        for keys in batched(stale):
+            insert_totals(model, totals_by(
+                group_columns, key_in(group_columns, keys), Score.quiz_id.not_in(quiz_ids)
+            ))
+
+def key_in(columns, keys):
+    # A row value IN alone cannot use an index in SQLite, so each column is also matched on its own
+    criteria = [column.in_({key[index] for key in keys}) for index, column in enumerate(columns)]
+    if len(columns) > 1:
+        criteria.append(tuple_(*columns).in_(keys))
+    return db.and_(*criteria)
+
+def batched(keys):
+    for start in range(0, len(keys), KEY_BATCH_SIZE):
+        yield keys[start:start + KEY_BATCH_SIZE]
+
+def ensure_rollups():
+    """Backfill the rollups of a database that has scores but predates them"""
+    if Score.query.first() and not UserStats.query.first():
+        rebuild_rollups()
+        db.session.commit()
@@ -0,0 +1,109 @@
+from collections import defaultdict
+from datetime import timedelta
+from flask import current_app as app
+from models import *
+
+EMAIL_SEND_HOUR = 10
+DUE_BATCH_SIZE = 5000
+
+# Every user has one EmailSchedule row per kind of scheduled email. The dispatcher
+# claims the rows that are due by moving next_due_at to the user's next send window
+# before the emails are queued, so a user is queued once per period however often
+# the dispatcher runs; shards record last_sent_at for the emails that went out.
+
+def next_daily_run(after, send_hour):
+    run = after.replace(hour=send_hour, minute=0, second=0, microsecond=0)
+    return run if run > after else run + timedelta(days=1)
+
+def next_monthly_run(after, send_hour):
+    run = after.replace(day=1, hour=send_hour, minute=0, second=0, microsecond=0)
+    if run > after:
+        return run
+    return (run + timedelta(days=32)).replace(day=1)
+
+EMAIL_SCHEDULES = {
+    'daily_reminders': next_daily_run,
+    'monthly_activity_report': next_monthly_run,
+}
+
+def default_send_hour():
+    return app.config.get('EMAIL_SEND_HOUR', EMAIL_SEND_HOUR)
+
+def add_schedules(user_id, now):
+    """ Schedule every kind of email for a new user, in the caller's transaction """
+    send_hour = default_send_hour()
+    for kind, next_run in EMAIL_SCHEDULES.items():
+        db.session.add(EmailSchedule(
+            user_id=user_id,
+            kind=kind,
+            send_hour=send_hour,
+            next_due_at=next_run(now, send_hour)
+        ))
+
+def ensure_schedules(now):
+    """ Backfill schedules for users created before they existed; returns the rows added """
+    send_hour = default_send_hour()
+    added = 0
+    for kind, next_run in EMAIL_SCHEDULES.items():
+        missing = db.select(
+            User.id,
+            db.literal(kind),
+            db.literal(send_hour),
+            db.literal(next_run(now, send_hour))
+        ).where(
+            User.role == 'user',
+            ~db.exists().where(EmailSchedule.user_id == User.id, EmailSchedule.kind == kind)
+        )
+        table = EmailSchedule.__table__
+        result = db.session.execute(table.insert().from_select(
+            [table.c.user_id, table.c.kind, table.c.send_hour, table.c.next_due_at],
+            missing
+        ))
+        added += result.rowcount
+    db.session.commit()
+    return added
+
+def claim_due(kind, now, limit=DUE_BATCH_SIZE):
+    """ Return up to `limit` user ids due for `kind` and advance them to their next window """
+    next_run = EMAIL_SCHEDULES[kind]
+    due = db.session.query(EmailSchedule.user_id, EmailSchedule.send_hour).filter(
+        EmailSchedule.kind == kind,
+        EmailSchedule.next_due_at <= now
+    ).order_by(EmailSchedule.next_due_at).limit(limit).with_for_update(skip_locked=True).all()
+
+    by_hour = defaultdict(list)
+    for user_id, send_hour in due:
+        by_hour[send_hour].append(user_id)
+    for send_hour, user_ids in by_hour.items():
+        EmailSchedule.query.filter(
+            EmailSchedule.kind == kind,
+            EmailSchedule.user_id.in_(user_ids)
+        ).update({EmailSchedule.next_due_at: next_run(now, send_hour)}, synchronize_session=False)
+    db.session.commit()
+    return [user_id for user_id, _ in due]
+
+def mark_sent(kind, user_ids, now):
+    if not user_ids:
+        return
+    EmailSchedule.query.filter(
+        EmailSchedule.kind == kind,
+        EmailSchedule.user_id.in_(user_ids)
+    ).update({EmailSchedule.last_sent_at: now}, synchronize_session=False)
+    db.session.commit()
+
+def set_send_hour(user_id, kind, send_hour, now):
+    """ Move a user's send window for `kind`; the next email goes out at the new hour """
+    schedule = EmailSchedule.query.get((user_id, kind))
+    if schedule is None:
+        schedule = EmailSchedule(user_id=user_id, kind=kind)
+        db.session.add(schedule)
+    schedule.send_hour = send_hour
+    schedule.next_due_at = EMAIL_SCHEDULES[kind](now, send_hour)
+    return schedule
+
+def serialize_schedule(schedule):
+    return {
+        'send_hour': schedule.send_hour,
+        'next_due_at': schedule.next_due_at.isoformat(),
+        'last_sent_at': schedule.last_sent_at.isoformat() if schedule.last_sent_at else None
+    }
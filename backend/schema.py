@@ -0,0 +1,79 @@
+from flask import current_app as app
+from sqlalchemy import inspect
+from models import db
+
+def upgrade_schema():
+    """ Bring an existing database up to date with the models.
+
+    db.create_all() only creates missing tables, so nullable columns and indexes
+    added to tables that already exist (e.g. in an old quizmaster.db) are created
+    here. A unique index whose columns already hold duplicates is not created; the
+    duplicates are logged and left for the remove-duplicates command. Returns the
+    names of the columns and indexes that were created.
+    """
+    inspector = inspect(db.engine)
+    created = []
+    for table in db.metadata.sorted_tables:
+        if inspector.has_table(table.name):
+            created += add_missing_columns(table, inspector)
+    for table, index in missing_indexes(inspect(db.engine)):
+        if index.unique:
+            duplicates = count_duplicates(table, list(index.columns))
+            if duplicates:
+                app.logger.error(
+                    "Not creating unique index %s: %d rows of %s repeat (%s). Run "
+                    "'flask remove-duplicates' to delete them, keeping the oldest of each",
+                    index.name, duplicates, table.name, ', '.join(column.name for column in index.columns)
+                )
+                continue
+        index.create(db.engine)
+        created.append(index.name)
+    return created
+
+def missing_indexes(inspector):
+    """(table, index) for every index of an existing table that the database lacks"""
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                yield table, index
+
+def add_missing_columns(table, inspector):
+    existing = {column['name'] for column in inspector.get_columns(table.name)}
+    added = []
+    with db.engine.begin() as conn:
+        for column in table.columns:
+            if column.name in existing or not column.nullable:
+                continue
+            column_type = column.type.compile(dialect=db.engine.dialect)
+            conn.exec_driver_sql(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}')
+            added.append(f'{table.name}.{column.name}')
+    return added
+
+def duplicate_rows(table, columns):
+    """Rows that would violate a unique index on `columns`, all but the oldest of each group"""
+    keep = db.select(db.func.min(table.c.id)).group_by(*columns)
+    return table.c.id.notin_(keep)
+
+def count_duplicates(table, columns):
+    with db.engine.connect() as conn:
+        return conn.execute(
+            db.select(db.func.count()).select_from(table).where(duplicate_rows(table, columns))
+        ).scalar()
+
+def remove_duplicates():
+    """ Delete the rows that keep unique indexes from being created, keeping the oldest row.
+
+    Returns {table name: rows deleted}; run upgrade_schema() afterwards to create the indexes.
+    """
+    removed = {}
+    for table, index in missing_indexes(inspect(db.engine)):
+        if not index.unique:
+            continue
+        with db.engine.begin() as conn:
+            result = conn.execute(table.delete().where(duplicate_rows(table, list(index.columns))))
+        if result.rowcount:
+            removed[table.name] = removed.get(table.name, 0) + result.rowcount
+    return removed
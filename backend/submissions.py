@@ -0,0 +1,222 @@
+import json
+from datetime import datetime
+from uuid import uuid4
+from flask import current_app as app
+from redis.exceptions import WatchError
+from sqlalchemy.exc import IntegrityError, DataError
+from models import *
+from rollups import record_attempt
+from caching import bump_version
+from redis_store import get_redis
+from events import publish_attempts
+
+SUBMISSION_QUEUE = 'submissions:queue'
+SUBMISSION_PROCESSING = 'submissions:processing'
+SUBMISSION_DEAD_LETTERS = 'submissions:dead'
+SUBMISSION_DRAIN_LOCK = 'submissions:drain-lock'
+SUBMISSION_DRAIN_LOCK_TIMEOUT = 5 * 60
+SUBMISSION_DEAD_LETTER_LIMIT = 10000
+SUBMISSION_BATCH_SIZE = 500
+SUBMISSION_RESULT_TTL = 24 * 60 * 60
+SCORE_FIELDS = ('quiz_id', 'user_id', 'total_scored', 'total_questions', 'idempotency_key')
+
+# With SUBMISSION_MODE = 'queued', attempt_quiz grades the answers and hands the score
+# to enqueue_submission() instead of writing it, so a quiz-close spike only costs a
+# couple of Redis commands per request. A worker writes the queue out with
+# drain_submissions(), one transaction per batch, and the outcome of every submission
+# stays under its result key for the status endpoint. Submissions that cannot be
+# written are kept in SUBMISSION_DEAD_LETTERS.
+
+def queued_submissions():
+    return app.config.get('SUBMISSION_MODE', 'sync') == 'queued'
+
+def result_key(quiz_id, user_id):
+    return f'submissions:result:{quiz_id}:{user_id}'
+
+def score_summary(total_scored, total_questions):
+    percentage = (total_scored / total_questions * 100) if total_questions > 0 else 0
+    return {
+        "score": f"{int(total_scored)}/{total_questions}",
+        "percentage": round(percentage, 2)
+    }
+
+def enqueue_submission(score):
+    """ Claim the score's (quiz, user) slot and queue it for the next drain.
+
+    Returns (status, result) where status is 'queued' for a new submission, 'replay'
+    for a resend with the same idempotency key and 'duplicate' otherwise.
+    """
+    r = get_redis()
+    key = result_key(score.quiz_id, score.user_id)
+    result = {
+        'status': 'pending',
+        'idempotency_key': score.idempotency_key,
+        **score_summary(score.total_scored, score.total_questions)
+    }
+    if not r.set(key, json.dumps(result), nx=True, ex=SUBMISSION_RESULT_TTL):
+        existing = get_result(score.quiz_id, score.user_id)
+        if existing and score.idempotency_key and existing['idempotency_key'] == score.idempotency_key:
+            return 'replay', existing
+        return 'duplicate', existing
+
+    submission = {field: getattr(score, field) for field in SCORE_FIELDS}
+    submission['time_stamp_of_attempt'] = score.time_stamp_of_attempt.isoformat()
+    r.rpush(SUBMISSION_QUEUE, json.dumps(submission))
+    return 'queued', result
+
+def get_result(quiz_id, user_id):
+    result = get_redis().get(result_key(quiz_id, user_id))
+    return json.loads(result) if result else None
+
+def drain_submissions(batch_size=None):
+    """ Write queued submissions to the database until the queue is empty.
+
+    Each batch is moved to a processing list before it is written and only dropped once
+    its outcomes are stored, so a worker that dies mid-batch loses nothing: the next
+    drain puts the batch back at the head of the queue. One drain runs at a time (see
+    SUBMISSION_DRAIN_LOCK); overlapping calls return 0. Returns the number of scores written.
+    """
+    r = get_redis()
+    batch_size = batch_size or app.config.get('SUBMISSION_BATCH_SIZE', SUBMISSION_BATCH_SIZE)
+    token = uuid4().hex
+    if not r.set(SUBMISSION_DRAIN_LOCK, token, nx=True, ex=SUBMISSION_DRAIN_LOCK_TIMEOUT):
+        return 0
+    try:
+        # Left over from a drain that did not finish
+        while r.lmove(SUBMISSION_PROCESSING, SUBMISSION_QUEUE, 'RIGHT', 'LEFT'):
+            pass
+        recorded = 0
+        while True:
+            pipe = r.pipeline()
+            for _ in range(batch_size):
+                pipe.lmove(SUBMISSION_QUEUE, SUBMISSION_PROCESSING, 'LEFT', 'RIGHT')
+            items = [item for item in pipe.execute() if item is not None]
+            if not items:
+                return recorded
+            submissions = []
+            for item in items:
+                try:
+                    submissions.append(parse_submission(item))
+                except (ValueError, KeyError, TypeError) as e:
+                    dead_letter(item, f"Unreadable submission: {e}")
+            try:
+                recorded += record_submissions(submissions)
+            except Exception:
+                db.session.rollback()
+                raise
+            r.delete(SUBMISSION_PROCESSING)
+    finally:
+        release_drain_lock(r, token)
+
+def release_drain_lock(r, token):
+    with r.pipeline() as pipe:
+        try:
+            pipe.watch(SUBMISSION_DRAIN_LOCK)
+            if pipe.get(SUBMISSION_DRAIN_LOCK) == token:
+                pipe.multi()
+                pipe.delete(SUBMISSION_DRAIN_LOCK)
+                pipe.execute()
+        except WatchError:
+            pass
+
+def parse_submission(item):
+    """The Score fields of a queued submission; raises ValueError, KeyError or TypeError if it is malformed"""
+    data = json.loads(item)
+    submission = {field: data[field] for field in SCORE_FIELDS}
+    submission['time_stamp_of_attempt'] = datetime.fromisoformat(data['time_stamp_of_attempt'])
+    return submission
+
+def dead_letter(submission, error):
+    """ Keep a submission that could not be written, for an admin to look into """
+    app.logger.error("Rejected queued submission %s: %s", submission, error)
+    if not isinstance(submission, str):
+        submission = json.dumps({**submission, 'time_stamp_of_attempt': submission['time_stamp_of_attempt'].isoformat()})
+    pipe = get_redis().pipeline()
+    pipe.rpush(SUBMISSION_DEAD_LETTERS, json.dumps({'submission': submission, 'error': error}))
+    pipe.ltrim(SUBMISSION_DEAD_LETTERS, -SUBMISSION_DEAD_LETTER_LIMIT, -1)
+    pipe.execute()
+
+def record_submissions(submissions):
+    """ Insert a batch of queued submissions with their rollups and store their outcomes.
+
+    Submissions that cannot be written (their quiz has been deleted, the user already
+    has a score, or the database refuses the row) are rejected rather than retried, so
+    one bad entry cannot hold up the rest of the queue.
+    """
+    quiz_ids = {submission['quiz_id'] for submission in submissions}
+    user_ids = {submission['user_id'] for submission in submissions}
+    # Scores written before the submission was queued (sync mode, or an expired claim),
+    # or by an earlier drain of this same batch that died before dropping it
+    existing = {(quiz_id, user_id): attempted_at for quiz_id, user_id, attempted_at in db.session.query(
+        Score.quiz_id, Score.user_id, Score.time_stamp_of_attempt
+    ).filter(
+        Score.quiz_id.in_(quiz_ids),
+        Score.user_id.in_(user_ids)
+    )}
+    subject_ids = dict(db.session.query(Quiz.id, Chapter.subject_id).join(
+        Chapter, Chapter.id == Quiz.chapter_id
+    ).filter(Quiz.id.in_(quiz_ids)).all())
+
+    pending = []
+    outcomes = []
+    for submission in submissions:
+        attempted_at = existing.get((submission['quiz_id'], submission['user_id']))
+        if attempted_at == submission['time_stamp_of_attempt']:
+            outcomes.append(recorded_result(submission))
+        elif attempted_at is not None:
+            outcomes.append(rejected_result(submission, "You have already attempted this quiz"))
+        elif submission['quiz_id'] not in subject_ids:
+            outcomes.append(rejected_result(submission, "This quiz no longer exists"))
+        else:
+            pending.append(submission)
+
+    try:
+        scores = write_scores(pending, subject_ids)
+    except (IntegrityError, DataError):
+        db.session.rollback()
+        # Find the rows the database refuses by writing the batch one at a time
+        scores = []
+        for submission in pending:
+            try:
+                scores += write_scores([submission], subject_ids)
+            except (IntegrityError, DataError) as e:
+                db.session.rollback()
+                outcomes.append(rejected_result(submission, "Your submission could not be recorded"))
+                dead_letter(submission, str(e.orig))
+    outcomes += [recorded_result(score) for score in scores]
+
+    pipe = get_redis().pipeline()
+    for (quiz_id, user_id), result in outcomes:
+        pipe.set(result_key(quiz_id, user_id), json.dumps(result), ex=SUBMISSION_RESULT_TTL)
+    pipe.execute()
+
+    if scores:
+        bump_version('attempts', *{f"scores:{score.user_id}" for score in scores})
+        publish_attempts(scores)
+    return len(scores)
+
+def write_scores(submissions, subject_ids):
+    """ Insert scores and their rollups in one transaction; returns the Score rows """
+    scores = [Score(**submission) for submission in submissions]
+    db.session.add_all(scores)
+    db.session.flush()
+    for score in scores:
+        record_attempt(score, subject_ids[score.quiz_id])
+    db.session.commit()
+    return scores
+
+def recorded_result(submission):
+    if isinstance(submission, Score):
+        submission = {field: getattr(submission, field) for field in SCORE_FIELDS}
+    return (submission['quiz_id'], submission['user_id']), {
+        'status': 'recorded',
+        'idempotency_key': submission['idempotency_key'],
+        **score_summary(submission['total_scored'], submission['total_questions'])
+    }
+
+def rejected_result(submission, error):
+    return (submission['quiz_id'], submission['user_id']), {
+        'status': 'rejected',
+        'idempotency_key': submission['idempotency_key'],
+        'error': error
+    }
@@ -1,102 +1,316 @@
-from workers import celery
+from workers import celery, ContextTask
 from models import *
+from celery import chord
 from celery.schedules import crontab
-from mailer import send_email
-from flask import render_template 
+from mailer import build_message, render_batch, send_bulk
+from submissions import queued_submissions, drain_submissions
+from schedules import claim_due, mark_sent
+from lifecycle import expire_quizzes, rebuild_quiz_index, open_quizzes
+from caching import bump_version
+from events import publish_active_quiz_changes
+from flask import current_app as app
 from datetime import datetime, timedelta
 
 @celery.on_after_finalize.connect
 def setup_periodic_tasks(sender, **kwargs):
-    # sender.add_periodic_task(crontab(minute=0, hour=10), send_daily_reminders.s(), name='send_daily_reminders at 10:00')
-    sender.add_periodic_task(crontab(minute='*/1'), send_daily_reminders.s(), name='send_daily_reminders every 60 seconds')
+    # Each user's emails go out in their own send window, see schedules.py
+    sender.add_periodic_task(crontab(minute='*/5'), dispatch_due_emails.s(), name='dispatch_due_emails every 5 minutes')
+    sender.add_periodic_task(crontab(minute='*/1'), update_quiz_lifecycle.s(), name='update_quiz_lifecycle every minute')
+    # The submission queue only exists with SUBMISSION_MODE = 'queued'
+    flask_app = ContextTask.flask_app
+    if flask_app is not None and flask_app.config.get('SUBMISSION_MODE') == 'queued':
+        sender.add_periodic_task(SUBMISSION_DRAIN_INTERVAL, drain_submission_queue.s(), name='drain_submission_queue every 2 seconds')
+
+
+REMINDER_CHUNK_SIZE = 500
+EMAIL_SHARD_SIZE = 2000
+SUBMISSION_DRAIN_INTERVAL = 2.0
+
+
+@celery.task()
+def drain_submission_queue():
+    """ Write quiz submissions queued by attempt_quiz in SUBMISSION_MODE = 'queued' """
+    if not queued_submissions():
+        return "Submission queue is disabled"
+    return f"Recorded {drain_submissions()} queued submissions"
+
+
+@celery.task()
+def update_quiz_lifecycle():
+    """ Expire published quizzes past their end date and rebuild the Redis active-quiz index """
+    now = datetime.utcnow()
+    expired = expire_quizzes(now)
+    db.session.commit()
+    if expired:
+        bump_version('quizzes')
+    indexed = rebuild_quiz_index(now)
+    # Connected admin dashboards only get counters pushed to them, they no longer poll
+    publish_active_quiz_changes()
+    return f"Expired {expired} quizzes, {indexed} published quizzes indexed"
+
+
+@celery.task()
+def dispatch_due_emails():
+    """ Queue the scheduled emails of the users whose send window has come """
+    now = datetime.utcnow()
+    dispatched = []
+    for job, shard_task in (
+        ('daily_reminders', send_daily_reminders_shard),
+        ('monthly_activity_report', send_monthly_activity_report_shard),
+    ):
+        while True:
+            user_ids = claim_due(job, now)
+            if not user_ids:
+                break
+            dispatched.append(dispatch_shards(shard_task, job, user_ids, now))
+    return dispatched or "No scheduled emails are due"
 
 
 @celery.task()
 def send_daily_reminders():
-    """ Send daily reminders to user for attempting new quizzes """
-    # Get all non-admin users
-    users = User.query.filter_by(role='user').all()
-    results = []
+    """ Send daily reminders to every user now, outside their schedule """
+    return dispatch_shards(send_daily_reminders_shard, 'daily_reminders', all_user_ids(), datetime.utcnow())
+
+
+@celery.task()
+def send_daily_reminders_shard(user_ids, now):
+    """ Send daily reminders to the given users """
+    now = datetime.fromisoformat(now)
+    # Active quizzes are the same for everyone, so look them up once per shard
+    active_quiz_ids = get_active_quiz_ids(now)
+    report = new_report()
+    for users in iter_user_chunks(reminder_chunk_size(), user_ids):
+        stats = get_reminder_stats(users, now, active_quiz_ids)
+        sent = send_reminder_chunk(users, stats, len(active_quiz_ids), report)
+        mark_sent('daily_reminders', sent, now)
+    
+    return report
+
+
+@celery.task()
+def summarize_shards(reports, job):
+    """ Aggregate the per-shard reports of a fanned out email job """
+    return {
+        'job': job,
+        'shards': len(reports),
+        'sent': sum(report['sent'] for report in reports),
+        'failed': sum(report['failed'] for report in reports),
+        'failures': [line for report in reports for line in report['failures']]
+    }
+
+
+def dispatch_shards(shard_task, job, user_ids, now):
+    """Split the user ids into EMAIL_SHARD_SIZE shards and run `shard_task` on each as a chord"""
+    if not user_ids:
+        return f"No users to process for {job}"
+    shard_size = app.config.get('EMAIL_SHARD_SIZE', EMAIL_SHARD_SIZE)
+    shards = [user_ids[start:start + shard_size] for start in range(0, len(user_ids), shard_size)]
+    result = chord(
+        shard_task.s(shard, now.isoformat()) for shard in shards
+    )(summarize_shards.s(job))
+    return f"Dispatched {len(shards)} {job} shards, summary task {result.id}"
+
+
+def all_user_ids():
+    return [user_id for user_id, in db.session.query(User.id).filter(User.role == 'user').order_by(User.id)]
+
+
+def reminder_chunk_size():
+    return app.config.get('REMINDER_CHUNK_SIZE', REMINDER_CHUNK_SIZE)
+
+
+def new_report():
+    return {'sent': 0, 'failed': 0, 'results': [], 'failures': []}
+
+
+def get_active_quiz_ids(now):
+    """Ids of the quizzes open at `now`, from the Redis index when it is available"""
+    open_quiz_counts = open_quizzes(now)
+    if open_quiz_counts is not None:
+        return list(open_quiz_counts)
+    return [quiz_id for quiz_id, in db.session.query(Quiz.id).filter(*active_quiz_filter(now))]
+
+
+def active_quiz_filter(now):
+    """Filter clauses selecting quizzes that are open for attempts at `now`"""
+    return (
+        Quiz.status == 'active',
+        Quiz.start_date <= now,
+        Quiz.end_date >= now
+    )
+
+
+def iter_user_chunks(chunk_size, user_ids):
+    """Load the given non-admin users in id order, `chunk_size` at a time"""
+    user_ids = sorted(user_ids)
+    for start in range(0, len(user_ids), chunk_size):
+        users = User.query.filter(
+            User.role == 'user',
+            User.id.in_(user_ids[start:start + chunk_size])
+        ).order_by(User.id).all()
+        if users:
+            yield users
+
+
+def get_reminder_stats(users, now, active_quiz_ids):
+    """Collect reminder figures for a chunk of users with two grouped queries.
+
+    Returns {user_id: (recent_count, average_percentage, attempted_active_count)}.
+    """
+    user_ids = [user.id for user in users]
+    last_day = now - timedelta(days=1)
+    percentage = Score.total_scored * 100.0 / Score.total_questions
+
+    # Quiz attempts in the last 24 hours, per user
+    recent = db.session.query(
+        Score.user_id,
+        db.func.count(Score.id),
+        db.func.avg(percentage)
+    ).filter(
+        Score.user_id.in_(user_ids),
+        Score.time_stamp_of_attempt.between(last_day, now)
+    ).group_by(Score.user_id).all()
+
+    # Currently active quizzes each user has already attempted
+    attempted = db.session.query(
+        Score.user_id,
+        db.func.count(db.distinct(Score.quiz_id))
+    ).filter(
+        Score.user_id.in_(user_ids),
+        Score.quiz_id.in_(active_quiz_ids)
+    ).group_by(Score.user_id).all()
+
+    recent_by_user = {user_id: (count, avg or 0) for user_id, count, avg in recent}
+    attempted_by_user = dict(attempted)
+    stats = {}
     for user in users:
-        now = datetime.utcnow()
-        last_day = now - timedelta(days=1)
-        # Get user's quiz attempts in the last 24 hours
-        recent_scores = Score.query.filter_by(user_id=user.id).filter(
-            Score.time_stamp_of_attempt.between(last_day, now)
-        ).all()
-        score_count = len(recent_scores)
-        
-        # Calculate average score
-        average_score = 0
-        if score_count > 0:
-            total_percentage = sum((score.total_scored / score.total_questions) * 100 for score in recent_scores)
-            average_score = round(total_percentage / score_count, 2)
+        score_count, average = recent_by_user.get(user.id, (0, 0))
+        stats[user.id] = (score_count, round(average, 2), attempted_by_user.get(user.id, 0))
+    return stats
+
+
+def send_reminder_chunk(users, stats, total_active, report):
+    """Render the reminder email for every user in the chunk and send them as one batch.
+
+    Returns the ids of the users whose email was sent.
+    """
+    contexts = []
+    summaries = []
+    for user in users:
+        score_count, average_score, attempted_active = stats[user.id]
         
         # Determine performance level and color
         performance_level, performance_color = get_performance_metrics(average_score)
         
-        # Get available quizzes that the user hasn't attempted
-        attempted_quiz_ids = [score.quiz_id for score in Score.query.filter_by(user_id=user.id).all()]
-        available_quizzes = Quiz.query.filter(
-            Quiz.id.notin_(attempted_quiz_ids),
-            Quiz.status == 'active',
-            Quiz.start_date <= now,
-            Quiz.end_date >= now
-        ).count()
-        
-        html_content = render_template(
-            'daily_reminder.html',
+        contexts.append(dict(
             user=user,
             recent_scores=score_count,
             average_score=average_score,
             performance_level=performance_level,
             performance_color=performance_color,
-            available_quizzes=available_quizzes
-        )
-        send_email(to=user.username, subject='Daily Quiz Reminder', body=html_content)
-        results.append(f"Mail sent to {user.full_name} - Recent scores: {score_count}, Performance: {average_score}% ({performance_level})")
-    
-    return "\n".join(results)
+            available_quizzes=total_active - attempted_active
+        ))
+        summaries.append(f"{user.full_name} - Recent scores: {score_count}, Performance: {average_score}% ({performance_level})")
+    messages = [
+        build_message(to=user.username, subject='Daily Quiz Reminder', body=html_content)
+        for user, html_content in zip(users, render_batch('daily_reminder.html', contexts))
+    ]
+    return record_outcomes(report, "Mail sent to", users, summaries, send_bulk(messages))
+
+
+def record_outcomes(report, prefix, users, summaries, outcomes):
+    """Add each per-user summary line to the shard report along with its delivery outcome.
+
+    Returns the ids of the users whose email was sent.
+    """
+    sent = []
+    for user, summary, (recipients, error) in zip(users, summaries, outcomes):
+        if error:
+            line = f"Failed to send to {summary}: {error}"
+            report['failed'] += 1
+            report['failures'].append(line)
+        else:
+            line = f"{prefix} {summary}"
+            report['sent'] += 1
+            sent.append(user.id)
+        report['results'].append(line)
+    return sent
 
 
 @celery.task()
 def send_monthly_activity_report():
-    # Get all non-admin users
-    users = User.query.filter_by(role='user').all()
-    results = []
+    """ Send every user a report of their activity over the last 30 days now, outside their schedule """
+    return dispatch_shards(
+        send_monthly_activity_report_shard, 'monthly_activity_report', all_user_ids(), datetime.utcnow()
+    )
+
+
+@celery.task()
+def send_monthly_activity_report_shard(user_ids, now):
+    """ Send monthly activity reports to the given users """
+    now = datetime.fromisoformat(now)
+    report = new_report()
+    for users in iter_user_chunks(reminder_chunk_size(), user_ids):
+        stats = get_monthly_stats(users, now)
+        sent = send_monthly_report_chunk(users, stats, report)
+        mark_sent('monthly_activity_report', sent, now)
+    
+    return report
+
+
+def get_monthly_stats(users, now):
+    """Collect last-30-days figures for a chunk of users with one grouped query.
+
+    Returns {user_id: (score_count, average_percentage, best_percentage)}.
+    """
+    last_month = now - timedelta(days=30)
+    percentage = Score.total_scored * 100.0 / Score.total_questions
+    rows = db.session.query(
+        Score.user_id,
+        db.func.count(Score.id),
+        db.func.avg(percentage),
+        db.func.max(percentage)
+    ).filter(
+        Score.user_id.in_([user.id for user in users]),
+        Score.time_stamp_of_attempt.between(last_month, now)
+    ).group_by(Score.user_id).all()
+
+    monthly_by_user = {user_id: (count, avg or 0, best or 0) for user_id, count, avg, best in rows}
+    stats = {}
     for user in users:
-        now = datetime.utcnow()
-        last_month = now - timedelta(days=30)
-        # Get user's scores from last month
-        monthly_scores = Score.query.filter_by(user_id=user.id).filter(
-            Score.time_stamp_of_attempt.between(last_month, now)
-        ).all()
-        score_count = len(monthly_scores)
-        
-        # Calculate average score and other metrics
-        average_score = 0
-        best_score = 0
-        if score_count > 0:
-            total_percentage = sum((score.total_scored / score.total_questions) * 100 for score in monthly_scores)
-            average_score = round(total_percentage / score_count, 2)
-            best_score = max((score.total_scored / score.total_questions) * 100 for score in monthly_scores)
+        score_count, average, best = monthly_by_user.get(user.id, (0, 0, 0))
+        stats[user.id] = (score_count, round(average, 2), round(best, 2))
+    return stats
+
+
+def send_monthly_report_chunk(users, stats, report):
+    """Render the monthly report for every user in the chunk and send them as one batch.
+
+    Returns the ids of the users whose report was sent.
+    """
+    contexts = []
+    summaries = []
+    for user in users:
+        score_count, average_score, best_score = stats[user.id]
         
         # Determine performance level and color
         performance_level, performance_color = get_performance_metrics(average_score)
         
-        html_content = render_template(
-            'monthly_activity_report.html',
+        contexts.append(dict(
             user=user,
             score_count=score_count,
             average_score=average_score,
-            best_score=round(best_score, 2),
+            best_score=best_score,
             performance_level=performance_level,
             performance_color=performance_color
-        )
-        send_email(to=user.username, subject='Monthly Activity Report', body=html_content)
-        results.append(f"Monthly report sent to {user.full_name} - Total scores: {score_count}, Avg: {average_score}%, Best: {round(best_score, 2)}%")
-    
-    return "\n".join(results)
+        ))
+        summaries.append(f"{user.full_name} - Total scores: {score_count}, Avg: {average_score}%, Best: {best_score}%")
+    messages = [
+        build_message(to=user.username, subject='Monthly Activity Report', body=html_content)
+        for user, html_content in zip(users, render_batch('monthly_activity_report.html', contexts))
+    ]
+    return record_outcomes(report, "Monthly report sent to", users, summaries, send_bulk(messages))
+
 
 def get_performance_metrics(percentage):
     """Helper function to determine performance level and color"""
@@ -0,0 +1,110 @@
+import os
+import sys
+from datetime import datetime, timedelta, date
+
+import fakeredis
+import pytest
+from sqlalchemy import event
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask_jwt_extended import create_access_token
+from app import create_app, bootstrap_db
+from models import *
+
+# Every test gets its own SQLite file, an in-process cache and a fakeredis instance,
+# so nothing here needs Redis, a mail server or a Celery worker.
+
+@pytest.fixture
+def make_app(tmp_path):
+    apps = []
+
+    def make(**config):
+        app = create_app({
+            'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'quizme.db'}",
+            'CACHE_TYPE': 'SimpleCache',
+            'BCRYPT_LOG_ROUNDS': 4,
+            'PASSWORD_HASH_WORKERS': 0,
+            **config
+        })
+        app.extensions['redis'] = fakeredis.FakeRedis(decode_responses=True)
+        with app.app_context():
+            bootstrap_db()
+        apps.append(app)
+        return app
+
+    yield make
+    for app in apps:
+        with app.app_context():
+            db.session.remove()
+            db.engine.dispose()
+
+@pytest.fixture
+def app(make_app):
+    return make_app()
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+@pytest.fixture
+def make_quiz(app):
+    """ Create an open quiz whose questions all have option 1 as the answer """
+    def make(questions=3, subject='Subject', **fields):
+        now = datetime.utcnow()
+        with app.app_context():
+            subject_row = Subject.query.filter_by(name=subject).first()
+            if subject_row is None:
+                subject_row = Subject(name=subject)
+                db.session.add(subject_row)
+                db.session.flush()
+            chapter = Chapter(subject_id=subject_row.id, name='Chapter')
+            db.session.add(chapter)
+            db.session.flush()
+            quiz = Quiz(
+                chapter_id=chapter.id,
+                title='Quiz',
+                start_date=fields.pop('start_date', now - timedelta(days=1)),
+                end_date=fields.pop('end_date', now + timedelta(days=1)),
+                time_duration=10,
+                status=fields.pop('status', 'active'),
+                **fields
+            )
+            db.session.add(quiz)
+            db.session.flush()
+            db.session.add_all(Question(
+                quiz_id=quiz.id,
+                question_statement=f'Question {index}?',
+                option1='a', option2='b', option3='c', option4='d',
+                correct_option=1
+            ) for index in range(questions))
+            db.session.commit()
+            return quiz.id
+    return make
+
+@pytest.fixture
+def make_user(app):
+    """ Create a user and return (user id, Authorization header) """
+    def make(username, role='user'):
+        with app.app_context():
+            user = User(username=username, password='password', full_name=username,
+                        qualification='B.Sc', dob=date(2000, 1, 1), role=role)
+            db.session.add(user)
+            db.session.commit()
+            token = create_access_token(identity={'id': user.id, 'username': username, 'role': role})
+            return user.id, {'Authorization': f'Bearer {token}'}
+    return make
+
+@pytest.fixture
+def statements(app):
+    """ A list that collects every SQL statement the app runs """
+    executed = []
+
+    def record(conn, cursor, statement, *args):
+        executed.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', record)
+    yield executed
+    event.remove(engine, 'before_cursor_execute', record)
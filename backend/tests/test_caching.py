@@ -0,0 +1,151 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import pytest
+from flask import Response
+
+from models import db, Quiz
+from caching import SINGLE_FLIGHT_WAIT, render_once
+from grading import get_answer_key
+from task import update_quiz_lifecycle
+
+def question_queries(statements):
+    return [statement for statement in statements if 'FROM questions' in statement]
+
+def quiz_payload(title='Quiz'):
+    now = datetime.utcnow()
+    return {
+        'title': title,
+        'start_date': (now - timedelta(days=1)).isoformat(),
+        'end_date': (now + timedelta(days=1)).isoformat(),
+        'time_duration': 10,
+        'status': 'active',
+    }
+
+def test_other_quiz_writes_keep_a_quizs_questions_cached(app, client, make_quiz, make_user, statements):
+    quiz_id = make_quiz()
+    ending_id = make_quiz(end_date=datetime.utcnow() - timedelta(minutes=1))
+    admin_id, admin = make_user('admin2@example.com', role='admin')
+    user_id, headers = make_user('student@example.com')
+    with app.app_context():
+        chapter_id = db.session.get(Quiz, quiz_id).chapter_id
+
+    assert client.get(f'/quizzes/{quiz_id}/questions', headers=headers).status_code == 200
+    with app.app_context():
+        get_answer_key(quiz_id)
+
+    # Another quiz is created and one expires on schedule
+    assert client.post(f'/chapters/{chapter_id}/quizzes', json=quiz_payload('New'), headers=admin).status_code == 201
+    with app.app_context():
+        update_quiz_lifecycle.run()
+    assert client.put(f'/quizzes/{ending_id}', json=quiz_payload('Reopened'), headers=admin).status_code == 200
+
+    statements.clear()
+    assert client.get(f'/quizzes/{quiz_id}/questions', headers=headers).status_code == 200
+    with app.app_context():
+        assert len(get_answer_key(quiz_id)) == 3
+    assert question_queries(statements) == []
+
+def test_editing_a_quiz_invalidates_its_own_questions(app, client, make_quiz, make_user, statements):
+    quiz_id = make_quiz()
+    admin_id, admin = make_user('admin2@example.com', role='admin')
+    user_id, headers = make_user('student@example.com')
+    assert client.get(f'/quizzes/{quiz_id}/questions', headers=headers).status_code == 200
+    with app.app_context():
+        get_answer_key(quiz_id)
+
+    assert client.put(f'/quizzes/{quiz_id}', json=quiz_payload('Edited'), headers=admin).status_code == 200
+
+    statements.clear()
+    assert client.get(f'/quizzes/{quiz_id}/questions', headers=headers).status_code == 200
+    with app.app_context():
+        get_answer_key(quiz_id)
+    assert len(question_queries(statements)) == 2
+
+def test_deleting_a_chapter_invalidates_its_quizzes_answer_keys(app, client, make_quiz, make_user):
+    quiz_id = make_quiz()
+    admin_id, admin = make_user('admin2@example.com', role='admin')
+    with app.app_context():
+        chapter_id = db.session.get(Quiz, quiz_id).chapter_id
+        assert len(get_answer_key(quiz_id)) == 3
+
+    assert client.delete(f'/chapters/{chapter_id}', headers=admin).status_code == 200
+    with app.app_context():
+        assert get_answer_key(quiz_id) == ()
+
+def slow_render(status, started, delay=0.3):
+    def render():
+        started.set()
+        time.sleep(delay)
+        return Response('body', status=status)
+    return render
+
+@pytest.mark.parametrize('status', [404, 500])
+def test_waiters_stop_waiting_when_the_render_is_not_cached(app, status):
+    started = threading.Event()
+
+    def hold():
+        with app.app_context():
+            render_once('view:test', slow_render(status, started), None)
+
+    holder = threading.Thread(target=hold)
+    holder.start()
+    assert started.wait(5)
+    start = time.monotonic()
+    with app.app_context():
+        response = render_once('view:test', lambda: Response('body', status=status), None)
+    holder.join()
+    assert response.status_code == status
+    assert time.monotonic() - start < SINGLE_FLIGHT_WAIT / 2
+
+def test_waiters_stop_waiting_when_the_renderer_raises(app):
+    started = threading.Event()
+
+    def failing_render():
+        started.set()
+        time.sleep(0.3)
+        raise RuntimeError("render failed")
+
+    def hold():
+        with app.app_context():
+            with pytest.raises(RuntimeError):
+                render_once('view:test', failing_render, None)
+
+    holder = threading.Thread(target=hold)
+    holder.start()
+    assert started.wait(5)
+    start = time.monotonic()
+    with app.app_context():
+        cached = render_once('view:test', lambda: Response('body'), None)
+    holder.join()
+    assert cached[:2] == (b'body', 200)
+    assert time.monotonic() - start < SINGLE_FLIGHT_WAIT / 2
+
+def test_concurrent_misses_for_a_missing_quiz_all_answer_quickly(app, make_user):
+    user_id, headers = make_user('student@example.com')
+
+    def fetch(_):
+        start = time.monotonic()
+        with app.test_client() as client:
+            status = client.get('/quizzes/999', headers=headers).status_code
+        return status, time.monotonic() - start
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(fetch, range(8)))
+    assert {status for status, elapsed in results} == {404}
+    assert max(elapsed for status, elapsed in results) < SINGLE_FLIGHT_WAIT / 2
+
+def test_concurrent_misses_render_once(app, client, make_quiz, make_user, statements):
+    quiz_id = make_quiz()
+    user_id, headers = make_user('student@example.com')
+
+    def fetch(_):
+        with app.test_client() as client:
+            return client.get(f'/quizzes/{quiz_id}/questions', headers=headers).status_code
+
+    statements.clear()
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        assert set(pool.map(fetch, range(8))) == {200}
+    assert len(question_queries(statements)) == 1
@@ -0,0 +1,36 @@
+import os
+
+import pytest
+
+import charts
+
+@pytest.fixture
+def chart_app(make_app):
+    app = make_app(CHART_WORKERS=1)
+    yield app
+    if charts._executor is not None:
+        charts._executor.shutdown(cancel_futures=True)
+        charts._executor = None
+
+def test_a_dead_chart_worker_is_a_503_and_replaced(chart_app, make_user):
+    admin_id, admin = make_user('admin2@example.com', role='admin')
+    client = chart_app.test_client()
+    with chart_app.app_context():
+        broken = charts.get_executor()
+    # The worker is killed, as by the OOM killer, while a chart is being requested
+    with pytest.raises(charts.BrokenProcessPool):
+        broken.submit(os._exit, 1).result()
+
+    response = client.get('/admin/statistics/chart', headers=admin)
+    assert response.status_code == 503
+    assert 'error' in response.json
+    response = client.get('/admin/statistics/chart?format=svg', headers=admin)
+    assert response.status_code == 200
+    assert response.mimetype == 'image/svg+xml'
+
+def test_a_slow_render_is_a_503(chart_app, make_user):
+    chart_app.config['CHART_RENDER_TIMEOUT'] = 0.01
+    admin_id, admin = make_user('admin2@example.com', role='admin')
+    response = chart_app.test_client().get('/admin/statistics/chart', headers=admin)
+    assert response.status_code == 503
+    assert response.json == {"error": "The chart is taking too long to render, try again later"}
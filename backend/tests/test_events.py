@@ -0,0 +1,95 @@
+import json
+import queue
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+import events
+from events import ACTIVITY_CHANNEL, ActivityBroadcaster
+from task import update_quiz_lifecycle
+
+CLIENTS = 4
+
+@pytest.fixture
+def streaming_app(app, monkeypatch):
+    app.config['ACTIVITY_HEARTBEAT_SECONDS'] = 0.2
+    # The broadcaster's subscriber thread is bound to the app that started it
+    monkeypatch.setattr(events, 'broadcaster', ActivityBroadcaster())
+    return app
+
+def open_streams(app, headers, count):
+    """ Connect `count` stream clients; returns a queue per client fed with its events """
+    inboxes = []
+    for _ in range(count):
+        inbox = queue.Queue()
+        response = app.test_client().get('/admin/activity/stream', headers=headers, buffered=False)
+        assert response.status_code == 200
+        assert response.mimetype == 'text/event-stream'
+        threading.Thread(target=read_events, args=(response, inbox), daemon=True).start()
+        inboxes.append(inbox)
+    redis = app.extensions['redis']
+    deadline = time.monotonic() + 5
+    while redis.pubsub_numsub(ACTIVITY_CHANNEL)[0][1] < 1:
+        assert time.monotonic() < deadline, "the subscriber thread never subscribed"
+        time.sleep(0.01)
+    return inboxes
+
+def read_events(response, inbox):
+    for chunk in response.response:
+        chunk = chunk.decode() if isinstance(chunk, bytes) else chunk
+        if chunk.startswith('data: '):
+            inbox.put(json.loads(chunk[len('data: '):]))
+
+def next_event(inbox, event_type, timeout=5):
+    deadline = time.monotonic() + timeout
+    while True:
+        event = inbox.get(timeout=max(0.01, deadline - time.monotonic()))
+        if event['type'] == event_type:
+            return event
+
+def test_every_stream_gets_attempts_and_new_user_counts(streaming_app, client, make_quiz, make_user):
+    quiz_id = make_quiz()
+    admin_id, admin = make_user('admin2@example.com', role='admin')
+    user_id, headers = make_user('student@example.com')
+    inboxes = open_streams(streaming_app, admin, CLIENTS)
+
+    assert client.post(f'/quizzes/{quiz_id}/attempt', json={'answers': {'1': 1}}, headers=headers).status_code == 200
+    for inbox in inboxes:
+        assert 'completed quiz' in next_event(inbox, 'attempt')['activity']['text']
+
+    assert client.post('/register', json={
+        'username': 'new@example.com', 'password': 'password', 'full_name': 'New User',
+        'qualification': 'B.Sc', 'dob': '2000-01-01'
+    }).status_code == 201
+    for inbox in inboxes:
+        assert next_event(inbox, 'summary')['stats']['users'] == 2
+
+def test_quizzes_opening_on_schedule_push_the_active_count(streaming_app, make_quiz, make_user):
+    make_quiz()
+    make_quiz(start_date=datetime.utcnow() + timedelta(seconds=1))
+    admin_id, admin = make_user('admin2@example.com', role='admin')
+    with streaming_app.app_context():
+        update_quiz_lifecycle.run()
+    inboxes = open_streams(streaming_app, admin, CLIENTS)
+
+    # Nothing changed, so nothing is pushed
+    with streaming_app.app_context():
+        update_quiz_lifecycle.run()
+        assert not events.publish_active_quiz_changes()
+    time.sleep(1.1)
+    with streaming_app.app_context():
+        update_quiz_lifecycle.run()
+    for inbox in inboxes:
+        assert next_event(inbox, 'summary')['stats']['activeQuizzes'] == 2
+        assert inbox.empty()
+
+def test_writes_skip_the_counters_when_no_stream_is_open(streaming_app, client, make_user, statements):
+    admin_id, admin = make_user('admin2@example.com', role='admin')
+    assert client.post('/subjects', json={'name': 'Physics'}, headers=admin).status_code == 201
+    assert client.post('/register', json={
+        'username': 'new@example.com', 'password': 'password', 'full_name': 'New User',
+        'qualification': 'B.Sc', 'dob': '2000-01-01'
+    }).status_code == 201
+    assert not [statement for statement in statements if 'count(' in statement]
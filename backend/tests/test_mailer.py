@@ -0,0 +1,121 @@
+import socketserver
+import threading
+
+import pytest
+
+from mailer import build_message, send_bulk
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    """ A minimal local SMTP server that keeps what it is sent.
+
+    Recipients in `refused` get a 550, and a connection is dropped without a reply
+    after `drop_after` messages, the way a server closing an idle session does.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, refused=(), drop_after=None):
+        super().__init__(('127.0.0.1', 0), SMTPHandler)
+        self.refused = set(refused)
+        self.drop_after = drop_after
+        self.connections = 0
+        self.delivered = []
+        self.lock = threading.Lock()
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+
+    def reply(self, line):
+        self.wfile.write(f'{line}\r\n'.encode())
+
+    def handle(self):
+        server = self.server
+        with server.lock:
+            server.connections += 1
+        sent = 0
+        recipients = []
+        self.reply('220 sink ready')
+        while True:
+            line = self.rfile.readline().decode().strip()
+            if not line:
+                return
+            command = line[:4].upper()
+            if command in ('EHLO', 'HELO'):
+                self.reply('250 sink')
+            elif command == 'MAIL':
+                if server.drop_after is not None and sent >= server.drop_after:
+                    return
+                recipients = []
+                self.reply('250 OK')
+            elif command == 'RCPT':
+                address = line.split(':', 1)[1].strip('<> ')
+                if address in server.refused:
+                    self.reply('550 No such user')
+                else:
+                    recipients.append(address)
+                    self.reply('250 OK')
+            elif command == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                while self.rfile.readline() not in (b'.\r\n', b''):
+                    pass
+                sent += 1
+                with server.lock:
+                    server.delivered.extend(recipients)
+                self.reply('250 OK')
+            elif command == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('250 OK')
+
+@pytest.fixture
+def sink():
+    servers = []
+
+    def start(**options):
+        server = SMTPSink(**options)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+def mail_app(make_app, server):
+    return make_app(MAIL_PORT=server.server_address[1], MAIL_SUPPRESS_SEND=False)
+
+def messages(count):
+    return [build_message('Hello', f'user{index}@example.com', '<p>Hello</p>') for index in range(count)]
+
+def test_send_bulk_opens_a_connection_per_batch(make_app, sink):
+    server = sink()
+    with mail_app(make_app, server).app_context():
+        outcomes = send_bulk(messages(5), batch_size=2)
+
+    assert [error for recipients, error in outcomes] == [None] * 5
+    assert server.delivered == [f'user{index}@example.com' for index in range(5)]
+    assert server.connections == 3
+
+def test_send_bulk_reconnects_once_when_the_connection_drops(make_app, sink):
+    server = sink(drop_after=2)
+    with mail_app(make_app, server).app_context():
+        outcomes = send_bulk(messages(5), batch_size=10)
+
+    assert [error for recipients, error in outcomes] == [None] * 5
+    assert len(server.delivered) == 5
+    # Two messages per connection before the server hangs up
+    assert server.connections == 3
+
+def test_send_bulk_reports_refused_recipients_and_carries_on(make_app, sink):
+    server = sink(refused={'user1@example.com'})
+    with mail_app(make_app, server).app_context():
+        outcomes = send_bulk(messages(3), batch_size=10)
+
+    assert outcomes[0] == (['user0@example.com'], None)
+    assert outcomes[1][0] == ['user1@example.com']
+    assert 'No such user' in outcomes[1][1]
+    assert outcomes[2] == (['user2@example.com'], None)
+    assert server.delivered == ['user0@example.com', 'user2@example.com']
+    # A refused recipient is not a broken connection
+    assert server.connections == 1
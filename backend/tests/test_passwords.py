@@ -0,0 +1,25 @@
+import os
+
+import pytest
+
+import passwords
+
+@pytest.fixture
+def pooled_app(make_app):
+    app = make_app(PASSWORD_HASH_WORKERS=1)
+    yield app
+    if passwords._executor is not None:
+        passwords._executor.shutdown()
+        passwords._executor = None
+
+def test_a_dead_hashing_worker_is_replaced(pooled_app):
+    with pooled_app.app_context():
+        password_hash = passwords.generate_password_hash('secret')
+        broken = passwords.get_executor(1)
+        # The worker is killed, as by the OOM killer
+        with pytest.raises(passwords.BrokenProcessPool):
+            broken.submit(os._exit, 1).result()
+
+        assert passwords.check_password_hash(password_hash, 'secret')
+        assert passwords.get_executor(1) is not broken
+        assert not passwords.check_password_hash(password_hash, 'wrong')
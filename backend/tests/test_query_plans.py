@@ -0,0 +1,95 @@
+import re
+from datetime import datetime
+
+import pytest
+from sqlalchemy import event
+
+from models import db
+from task import get_reminder_stats, get_active_quiz_ids, iter_user_chunks
+
+# Every table a hot query reads must be searched through an index or the rowid. Any
+# SCAN is a failure, "SCAN scores USING INDEX ..." included: that still reads the
+# whole index.
+TABLE_ACCESS = re.compile(r'^(?:SCAN|SEARCH) (\w+)')
+INDEXED_SEARCH = re.compile(r'^SEARCH \w+ USING (?:COVERING INDEX|INDEX|INTEGER PRIMARY KEY) ')
+
+@pytest.fixture
+def capture_selects(app):
+    """ Record the SELECT statements run inside the block, with their parameters """
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT'):
+            statements.append((statement, parameters))
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', record)
+    yield statements
+    event.remove(engine, 'before_cursor_execute', record)
+
+def query_plans(app, statements):
+    """ The EXPLAIN QUERY PLAN lines of every captured statement """
+    with app.app_context():
+        with db.engine.connect() as conn:
+            return [
+                row.detail
+                for statement, parameters in statements
+                for row in conn.exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}', parameters)
+            ]
+
+def unindexed_reads(plans):
+    return [
+        line for line in plans
+        if TABLE_ACCESS.match(line) and TABLE_ACCESS.match(line).group(1) in db.metadata.tables
+        and not INDEXED_SEARCH.match(line)
+    ]
+
+@pytest.fixture
+def attempted(app, client, make_quiz, make_user):
+    quiz_id = make_quiz()
+    make_quiz(subject='Other')
+    user_id, headers = make_user('student@example.com')
+    response = client.post(f'/quizzes/{quiz_id}/attempt', json={'answers': {'1': 1}}, headers=headers)
+    assert response.status_code == 200
+    return quiz_id, user_id, headers
+
+def test_my_scores_uses_indexes(app, client, attempted, capture_selects):
+    quiz_id, user_id, headers = attempted
+    assert client.get('/my-scores', headers=headers).status_code == 200
+    plans = query_plans(app, capture_selects)
+    assert 'SEARCH scores USING INDEX ix_scores_user_id_time (user_id=?)' in plans
+    assert unindexed_reads(plans) == []
+
+def test_available_quizzes_uses_indexes(app, client, attempted, capture_selects):
+    quiz_id, user_id, headers = attempted
+    response = client.get('/available-quizzes', headers=headers)
+    assert response.status_code == 200
+    assert len(response.json) == 1
+    plans = query_plans(app, capture_selects)
+    assert 'SEARCH quizzes USING INDEX ix_quizzes_status_dates (status=? AND start_date<?)' in plans
+    assert 'SEARCH scores USING INDEX ix_scores_user_id_time (user_id=?)' in plans
+    assert unindexed_reads(plans) == []
+
+def test_duplicate_attempt_check_uses_indexes(app, client, attempted, capture_selects):
+    quiz_id, user_id, headers = attempted
+    response = client.post(f'/quizzes/{quiz_id}/attempt', json={'answers': {'1': 1}},
+                           headers={**headers, 'Idempotency-Key': 'another-key'})
+    assert response.status_code == 400
+    plans = query_plans(app, capture_selects)
+    assert 'SEARCH scores USING INDEX uq_scores_quiz_id_user_id (quiz_id=? AND user_id=?)' in plans
+    assert unindexed_reads(plans) == []
+
+def test_reminder_queries_use_indexes(app, attempted, capture_selects):
+    quiz_id, user_id, headers = attempted
+    now = datetime.utcnow()
+    with app.app_context():
+        active_quiz_ids = get_active_quiz_ids(now)
+        for users in iter_user_chunks(500, [user_id]):
+            stats = get_reminder_stats(users, now, active_quiz_ids)
+    assert stats[user_id][0] == 1
+    plans = query_plans(app, capture_selects)
+    assert any(line.startswith('SEARCH scores USING INDEX ix_scores_user_id_time (user_id=? AND time_stamp_of_attempt>')
+               for line in plans)
+    assert 'SEARCH scores USING COVERING INDEX uq_scores_quiz_id_user_id (quiz_id=? AND user_id=?)' in plans
+    assert unindexed_reads(plans) == []
@@ -0,0 +1,43 @@
+import pytest
+
+from models import Question
+
+CSV_ROWS = (
+    'question_statement,option1,option2,option3,option4,correct_option\r\n'
+    'What is 2 + 2?,3,4,5,6,2\r\n'
+    'What is 3 + 3?,6,7,8,9,1\r\n'
+)
+
+@pytest.mark.parametrize('encoded', [
+    CSV_ROWS.encode('utf-8'),
+    CSV_ROWS.encode('utf-8-sig'),
+], ids=['plain', 'byte-order-mark'])
+def test_csv_import(app, client, make_quiz, make_user, encoded):
+    quiz_id = make_quiz(questions=0)
+    admin_id, admin = make_user('admin2@example.com', role='admin')
+    response = client.post(f'/quizzes/{quiz_id}/questions/import', data=encoded,
+                           headers={**admin, 'Content-Type': 'text/csv'})
+    assert response.status_code == 201, response.json
+    assert response.json['imported'] == 2
+    with app.app_context():
+        statements = [question.question_statement for question in Question.query.filter_by(quiz_id=quiz_id)]
+    assert statements == ['What is 2 + 2?', 'What is 3 + 3?']
+
+def test_import_reports_invalid_rows(client, make_quiz, make_user):
+    quiz_id = make_quiz(questions=0)
+    admin_id, admin = make_user('admin2@example.com', role='admin')
+    rows = CSV_ROWS + 'Missing options?,,,,,1\r\n'
+    response = client.post(f'/quizzes/{quiz_id}/questions/import', data=rows.encode('utf-8-sig'),
+                           headers={**admin, 'Content-Type': 'text/csv'})
+    assert response.status_code == 400
+    assert response.json['details'] == ['Line 4: Missing required fields: option1, option2, option3, option4']
+
+def test_adding_a_question_to_a_missing_quiz_is_a_404(app, client, make_user):
+    admin_id, admin = make_user('admin2@example.com', role='admin')
+    response = client.post('/quizzes/999/questions', headers=admin, json={
+        'question_statement': 'Orphan?', 'option1': 'a', 'option2': 'b', 'option3': 'c', 'option4': 'd',
+        'correct_option': 1
+    })
+    assert response.status_code == 404
+    with app.app_context():
+        assert Question.query.filter_by(quiz_id=999).count() == 0
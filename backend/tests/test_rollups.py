@@ -0,0 +1,77 @@
+from datetime import datetime
+
+import pytest
+from sqlalchemy.dialects import postgresql
+
+import rollups
+from models import *
+from rollups import record_attempt, rebuild_rollups
+
+def rollup_rows():
+    rows = {}
+    for model, group_columns in rollups.ROLLUPS:
+        rows[model.__tablename__] = sorted(
+            (tuple(getattr(row, column.key) for column in group_columns),
+             row.attempts, round(row.percentage_sum, 6), round(row.best_percentage, 6))
+            for row in model.query.all()
+        )
+    return rows
+
+def attempt(quiz_id, user_id, scored):
+    score = Score(quiz_id=quiz_id, user_id=user_id, time_stamp_of_attempt=datetime.utcnow(),
+                  total_scored=scored, total_questions=4)
+    db.session.add(score)
+    db.session.flush()
+    record_attempt(score, Quiz.query.get(quiz_id).chapter.subject_id)
+    db.session.commit()
+
+@pytest.fixture(params=['upsert', 'savepoint'])
+def bump_strategy(request, monkeypatch):
+    if request.param == 'savepoint':
+        monkeypatch.setattr(rollups, 'UPSERT_INSERTS', {})
+    return request.param
+
+def test_incremental_rollups_match_a_rebuild(app, make_quiz, make_user, bump_strategy):
+    quizzes = [make_quiz(), make_quiz(), make_quiz(subject='Other')]
+    users = [make_user(f'user{index}@example.com')[0] for index in range(3)]
+    with app.app_context():
+        for index, (quiz_id, user_id) in enumerate((q, u) for q in quizzes for u in users):
+            attempt(quiz_id, user_id, index % 5)
+        incremental = rollup_rows()
+        rebuild_rollups()
+        db.session.commit()
+        assert rollup_rows() == incremental
+        assert UserStats.query.get(users[0]).attempts == 3
+        assert SubjectStats.query.count() == 2
+
+def test_upsert_compiles_for_postgresql(app):
+    table = UserStats.__table__
+    statement = postgresql.insert(table).values(
+        user_id=1, attempts=1, percentage_sum=50, best_percentage=50, last_attempt_at=datetime.utcnow()
+    ).on_conflict_do_update(index_elements=['user_id'], set_=rollups.increments(table.c, 50, datetime.utcnow()))
+    sql = str(statement.compile(dialect=postgresql.dialect()))
+    assert 'ON CONFLICT (user_id) DO UPDATE SET attempts = (user_stats.attempts + ' in sql
+
+@pytest.mark.parametrize('target', ['quiz', 'chapter', 'subject'])
+def test_deletes_take_their_scores_out_of_the_rollups(app, client, make_quiz, make_user, monkeypatch, target):
+    monkeypatch.setattr(rollups, 'KEY_BATCH_SIZE', 2)
+    quizzes = [make_quiz(), make_quiz(), make_quiz(subject='Other')]
+    users = [make_user(f'user{index}@example.com')[0] for index in range(4)]
+    admin_id, admin = make_user('admin2@example.com', role='admin')
+    with app.app_context():
+        # The deleted quiz holds some users' best or latest attempt, and all of the last user's
+        for index, (quiz_id, user_id) in enumerate((q, u) for q in quizzes for u in users[:3]):
+            attempt(quiz_id, user_id, (index * 3) % 5)
+        attempt(quizzes[0], users[3], 4)
+        quiz = Quiz.query.get(quizzes[0])
+        url = {'quiz': f'/quizzes/{quiz.id}', 'chapter': f'/chapters/{quiz.chapter_id}',
+               'subject': f'/subjects/{quiz.chapter.subject_id}'}[target]
+
+    assert client.delete(url, headers=admin).status_code == 200
+    with app.app_context():
+        incremental = rollup_rows()
+        rebuild_rollups()
+        db.session.commit()
+        assert rollup_rows() == incremental
+        assert UserStats.query.get(users[3]) is None
+        assert QuizStats.query.get(quizzes[0]) is None
@@ -0,0 +1,34 @@
+from datetime import datetime
+
+from sqlalchemy import inspect
+
+from app import bootstrap_db
+from models import *
+
+def score_indexes(app):
+    with app.app_context():
+        return {index['name'] for index in inspect(db.engine).get_indexes('scores')}
+
+def test_duplicate_scores_block_the_unique_index_until_removed(app, make_quiz, make_user, caplog):
+    quiz_id = make_quiz()
+    user_id, headers = make_user('student@example.com')
+    with app.app_context():
+        # A database from before the index, where a double submit left two scores
+        db.session.execute(db.text('DROP INDEX uq_scores_quiz_id_user_id'))
+        for scored in (1, 3):
+            db.session.add(Score(quiz_id=quiz_id, user_id=user_id, time_stamp_of_attempt=datetime.utcnow(),
+                                 total_scored=scored, total_questions=3))
+        db.session.commit()
+
+        bootstrap_db()
+        assert Score.query.count() == 2
+    assert 'uq_scores_quiz_id_user_id' not in score_indexes(app)
+    assert "Not creating unique index uq_scores_quiz_id_user_id: 1 rows of scores repeat" in caplog.text
+
+    result = app.test_cli_runner().invoke(args=['remove-duplicates'])
+    assert result.exit_code == 0, result.output
+    assert "Removed 1 duplicate rows from scores" in result.output
+    assert 'uq_scores_quiz_id_user_id' in score_indexes(app)
+    with app.app_context():
+        assert [score.total_scored for score in Score.query] == [1]
+        assert UserStats.query.get(user_id).attempts == 1
@@ -0,0 +1,51 @@
+from datetime import datetime
+
+import pytest
+
+from caching import cache
+from lifecycle import rebuild_quiz_index
+from models import *
+from rollups import record_attempt
+
+ROWS = 25
+
+ENDPOINTS = ['/my-scores', '/available-quizzes', '/admin/dashboard-stats']
+
+def add_rows(app, make_quiz, make_user, user_id, count):
+    """ `count` quizzes the user has attempted, `count` open ones they have not and `count` other users """
+    with app.app_context():
+        quiz_ids = [make_quiz(subject=f'Subject {index % 3}') for index in range(count)]
+        for quiz_id in quiz_ids:
+            score = Score(quiz_id=quiz_id, user_id=user_id, time_stamp_of_attempt=datetime.utcnow(),
+                          total_scored=2, total_questions=3)
+            db.session.add(score)
+            db.session.flush()
+            record_attempt(score, db.session.get(Quiz, quiz_id).chapter.subject_id)
+        db.session.commit()
+    for index in range(count):
+        make_quiz(subject=f'Subject {index % 3}')
+        make_user(f'other{user_id}-{count}-{index}@example.com')
+
+def count_statements(app, client, statements, url, headers):
+    with app.app_context():
+        cache.clear()
+        rebuild_quiz_index(datetime.utcnow())
+    statements.clear()
+    response = client.get(url, headers=headers)
+    assert response.status_code == 200
+    return len(statements)
+
+@pytest.mark.parametrize('url', ENDPOINTS)
+def test_statement_count_does_not_grow_with_rows(app, client, make_quiz, make_user, statements, url):
+    user_id, student = make_user('student@example.com')
+    admin_id, admin = make_user('admin2@example.com', role='admin')
+    headers = admin if url.startswith('/admin') else student
+
+    add_rows(app, make_quiz, make_user, user_id, 1)
+    one_row = count_statements(app, client, statements, url, headers)
+    add_rows(app, make_quiz, make_user, user_id, ROWS - 1)
+    many_rows = count_statements(app, client, statements, url, headers)
+
+    assert many_rows == one_row
+    if url != '/admin/dashboard-stats':
+        assert len(client.get(url, headers=headers).json) == ROWS
@@ -0,0 +1,161 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import pytest
+
+import submissions
+from models import *
+from submissions import (
+    SUBMISSION_QUEUE, SUBMISSION_PROCESSING, SUBMISSION_DEAD_LETTERS, SUBMISSION_DRAIN_LOCK,
+    drain_submissions, record_submissions, parse_submission
+)
+
+SUBMITTERS = 5
+ATTEMPTS_PER_USER = 6
+
+def submit(app, quiz_id, headers, key=None, answers=None):
+    if key:
+        headers = {**headers, 'Idempotency-Key': key}
+    with app.test_client() as client:
+        response = client.post(f'/quizzes/{quiz_id}/attempt', json={'answers': answers or {'1': 1}}, headers=headers)
+        return response.status_code, response.json
+
+def rollup_attempts(app, quiz_id, user_ids):
+    with app.app_context():
+        return (
+            {user_id: UserStats.query.get(user_id).attempts for user_id in user_ids},
+            QuizStats.query.get(quiz_id).attempts,
+        )
+
+def test_concurrent_submissions_record_one_score_per_user(app, make_quiz, make_user):
+    quiz_id = make_quiz()
+    users = [make_user(f'user{index}@example.com') for index in range(SUBMITTERS)]
+    jobs = [(headers, f'key-{user_id}-{attempt}') for user_id, headers in users for attempt in range(ATTEMPTS_PER_USER)]
+
+    with ThreadPoolExecutor(max_workers=len(jobs)) as pool:
+        results = list(pool.map(lambda job: submit(app, quiz_id, *job), jobs))
+
+    statuses = [status for status, body in results]
+    assert statuses.count(200) == SUBMITTERS
+    assert statuses.count(400) == len(jobs) - SUBMITTERS
+    with app.app_context():
+        scores = db.session.query(Score.user_id, db.func.count()).filter_by(quiz_id=quiz_id).group_by(Score.user_id).all()
+    user_ids = [user_id for user_id, headers in users]
+    assert dict(scores) == {user_id: 1 for user_id in user_ids}
+    assert rollup_attempts(app, quiz_id, user_ids) == ({user_id: 1 for user_id in user_ids}, SUBMITTERS)
+
+def test_concurrent_resends_with_one_key_all_get_the_result(app, make_quiz, make_user):
+    quiz_id = make_quiz()
+    user_id, headers = make_user('student@example.com')
+
+    with ThreadPoolExecutor(max_workers=ATTEMPTS_PER_USER) as pool:
+        results = list(pool.map(lambda _: submit(app, quiz_id, headers, 'same-key'), range(ATTEMPTS_PER_USER)))
+
+    assert {status for status, body in results} == {200}
+    assert {body['score'] for status, body in results} == {'1/3'}
+    with app.app_context():
+        assert Score.query.filter_by(quiz_id=quiz_id, user_id=user_id).count() == 1
+    assert rollup_attempts(app, quiz_id, [user_id]) == ({user_id: 1}, 1)
+
+def test_resubmission_replays_only_for_the_same_key(app, make_quiz, make_user):
+    quiz_id = make_quiz()
+    user_id, headers = make_user('student@example.com')
+
+    first = submit(app, quiz_id, headers, 'original', {'1': 1, '2': 1})
+    assert first == (200, {'message': 'Quiz submitted successfully', 'score': '2/3', 'percentage': 66.67})
+    # A resend carries the same key and gets the original result, even with other answers
+    assert submit(app, quiz_id, headers, 'original', {'1': 2}) == first
+    assert submit(app, quiz_id, headers, 'another-key')[0] == 400
+    assert submit(app, quiz_id, headers)[0] == 400
+    with app.app_context():
+        assert Score.query.filter_by(quiz_id=quiz_id, user_id=user_id).count() == 1
+
+# Write-behind queue, SUBMISSION_MODE = 'queued'
+
+@pytest.fixture
+def queued(app):
+    app.config['SUBMISSION_MODE'] = 'queued'
+    return app
+
+def redis_list(app, key):
+    return app.extensions['redis'].lrange(key, 0, -1)
+
+def status(client, quiz_id, headers):
+    return client.get(f'/quizzes/{quiz_id}/attempt/status', headers=headers).json
+
+def test_queued_submission_for_a_deleted_quiz_is_rejected(queued, client, make_quiz, make_user):
+    kept, deleted = make_quiz(), make_quiz(subject='Other')
+    admin_id, admin = make_user('admin2@example.com', role='admin')
+    users = [make_user(f'user{index}@example.com') for index in range(2)]
+    for user_id, headers in users:
+        for quiz_id in (deleted, kept):
+            assert submit(queued, quiz_id, headers)[0] == 202
+    assert client.delete(f'/quizzes/{deleted}', headers=admin).status_code == 200
+
+    with queued.app_context():
+        assert drain_submissions() == 2
+    for user_id, headers in users:
+        assert status(client, kept, headers)['status'] == 'recorded'
+        assert status(client, deleted, headers) == {'status': 'rejected', 'error': "This quiz no longer exists"}
+    assert redis_list(queued, SUBMISSION_QUEUE) == []
+    assert redis_list(queued, SUBMISSION_PROCESSING) == []
+
+def test_a_drain_that_dies_loses_no_submissions(queued, client, make_quiz, make_user, monkeypatch):
+    quiz_id = make_quiz()
+    users = [make_user(f'user{index}@example.com') for index in range(3)]
+    for user_id, headers in users:
+        assert submit(queued, quiz_id, headers)[0] == 202
+
+    def crash(submissions):
+        raise RuntimeError("worker lost")
+
+    with queued.app_context():
+        monkeypatch.setattr(submissions, 'record_submissions', crash)
+        with pytest.raises(RuntimeError):
+            drain_submissions()
+        assert len(redis_list(queued, SUBMISSION_PROCESSING)) == 3
+        monkeypatch.undo()
+        assert drain_submissions() == 3
+    assert redis_list(queued, SUBMISSION_PROCESSING) == []
+    assert {status(client, quiz_id, headers)['status'] for user_id, headers in users} == {'recorded'}
+
+def test_a_batch_written_before_the_drain_died_is_not_rejected(queued, client, make_quiz, make_user):
+    quiz_id = make_quiz()
+    users = [make_user(f'user{index}@example.com') for index in range(3)]
+    for user_id, headers in users:
+        assert submit(queued, quiz_id, headers)[0] == 202
+    r = queued.extensions['redis']
+    with queued.app_context():
+        # The batch is committed but the worker dies before dropping it
+        items = [r.lmove(SUBMISSION_QUEUE, SUBMISSION_PROCESSING, 'LEFT', 'RIGHT') for _ in users]
+        assert record_submissions([parse_submission(item) for item in items]) == 3
+        assert drain_submissions() == 0
+        assert Score.query.filter_by(quiz_id=quiz_id).count() == 3
+    assert {status(client, quiz_id, headers)['status'] for user_id, headers in users} == {'recorded'}
+
+def test_submissions_the_database_refuses_go_to_dead_letters(queued, client, make_quiz, make_user):
+    quiz_id = make_quiz()
+    (good_id, good), (bad_id, bad) = make_user('good@example.com'), make_user('bad@example.com')
+    assert submit(queued, quiz_id, good)[0] == 202
+    r = queued.extensions['redis']
+    r.rpush(SUBMISSION_QUEUE, 'not json', json.dumps({
+        'quiz_id': quiz_id, 'user_id': bad_id, 'total_scored': None, 'total_questions': 3,
+        'idempotency_key': None, 'time_stamp_of_attempt': datetime.utcnow().isoformat()
+    }))
+
+    with queued.app_context():
+        assert drain_submissions() == 1
+        assert drain_submissions() == 0
+    assert status(client, quiz_id, good)['status'] == 'recorded'
+    assert status(client, quiz_id, bad)['status'] == 'rejected'
+    dead = [json.loads(entry) for entry in redis_list(queued, SUBMISSION_DEAD_LETTERS)]
+    assert [entry['submission'] == 'not json' for entry in dead] == [True, False]
+    assert redis_list(queued, SUBMISSION_QUEUE) == []
+
+def test_only_one_drain_runs_at_a_time(queued):
+    queued.extensions['redis'].set(SUBMISSION_DRAIN_LOCK, 'another worker')
+    queued.extensions['redis'].rpush(SUBMISSION_QUEUE, 'not json')
+    with queued.app_context():
+        assert drain_submissions() == 0
+    assert redis_list(queued, SUBMISSION_QUEUE) == ['not json']
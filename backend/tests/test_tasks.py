@@ -0,0 +1,62 @@
+from collections import Counter
+
+import pytest
+
+import task
+from workers import celery
+
+USERS = 5
+SHARD_SIZE = 2
+
+@pytest.fixture
+def eager(app, monkeypatch):
+    """ Run tasks, chords included, inline instead of through a broker """
+    monkeypatch.setitem(celery.conf, 'task_always_eager', True)
+    monkeypatch.setitem(celery.conf, 'task_eager_propagates', True)
+    app.config['EMAIL_SHARD_SIZE'] = SHARD_SIZE
+    app.config['REMINDER_CHUNK_SIZE'] = 1
+    return app
+
+@pytest.fixture
+def outbox(monkeypatch):
+    """ Recipients of every message handed to send_bulk; user1 is refused """
+    sent = []
+
+    def send_bulk(messages):
+        sent.extend(recipient for message in messages for recipient in message.recipients)
+        return [(message.recipients, "refused" if message.recipients == ['user1@example.com'] else None)
+                for message in messages]
+
+    monkeypatch.setattr(task, 'send_bulk', send_bulk)
+    return sent
+
+@pytest.fixture
+def summaries(monkeypatch):
+    """ The reports summarize_shards returns """
+    reports = []
+    summarize = task.summarize_shards.run
+
+    def run(*args, **kwargs):
+        reports.append(summarize(*args, **kwargs))
+        return reports[-1]
+
+    monkeypatch.setattr(task.summarize_shards, 'run', run)
+    return reports
+
+@pytest.mark.parametrize('job_task, job', [
+    (task.send_daily_reminders, 'daily_reminders'),
+    (task.send_monthly_activity_report, 'monthly_activity_report'),
+])
+def test_email_jobs_fan_out_in_shards(eager, make_quiz, make_user, outbox, summaries, job_task, job):
+    make_quiz()
+    for index in range(USERS):
+        make_user(f'user{index}@example.com')
+
+    assert job_task.delay().get().startswith(f"Dispatched 3 {job} shards")
+
+    assert Counter(outbox) == {f'user{index}@example.com': 1 for index in range(USERS)}
+    [summary] = summaries
+    assert summary['job'] == job
+    assert summary['shards'] == 3
+    assert (summary['sent'], summary['failed']) == (USERS - 1, 1)
+    assert len(summary['failures']) == 1 and summary['failures'][0].endswith(': refused')
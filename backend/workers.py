@@ -1,13 +1,19 @@
 from celery import Celery
-from flask import current_app as app
 
 celery = Celery('Application Jobs')
 
 class ContextTask(celery.Task):
+    flask_app = None
+
     def __call__(self, *args, **kwargs):
-        with app.app_context():
+        with self.flask_app.app_context():
             return self.run(*args, **kwargs)
 
-
-
-
+def init_app(app):
+    """ Point celery at the app's broker and run every task inside the app's context """
+    celery.conf.update(
+        broker_url=app.config['CELERY_BROKER_URL'],
+        result_backend=app.config['CELERY_RESULT_BACKEND']
+    )
+    ContextTask.flask_app = app
+    celery.Task = ContextTask